@@ -11,7 +11,7 @@ functions."""
 
 from aima.utils import (
     is_in, argmin, argmax, argmax_random_tie, probability, weighted_sampler,
-    memoize, print_table, open_data, PriorityQueue, name,
+    memoize, print_table, open_data, PriorityQueue, IndexedPriorityQueue, name,
     distance, vector_add
 )
 
@@ -269,8 +269,8 @@ def best_first_graph_search(problem, f, n_saved_explored_states=0, max_iter=floa
     f = memoize(f, 'f')
     node = Node(problem.initial)
 
-    # this Python priority queue is super slow!
-    frontier = PriorityQueue('min', f)
+    # indexed by state, with O(log n) updates
+    frontier = IndexedPriorityQueue('min', f)
     frontier.append(node)
     explored = set()
     nexplored = 0
@@ -291,8 +291,7 @@ def best_first_graph_search(problem, f, n_saved_explored_states=0, max_iter=floa
                 frontier.append(child)
             elif child in frontier:
                 if f(child) < frontier[child]:
-                    del frontier[child]
-                    frontier.append(child)
+                    frontier.update(child)
 
     return None, nexplored, explored_states
 
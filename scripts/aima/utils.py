@@ -796,6 +796,139 @@ class PriorityQueue:
         heapq.heapify(self.heap)
 
 
+class IndexedPriorityQueue:
+    """A PriorityQueue of hashable items, in which each item appears at most
+    once (according to == and hash). The position of each item in the binary
+    heap is indexed, so that membership tests and lookups take O(1), and
+    deletions and priority updates take O(log n). Items with the same f(x) are
+    returned in insertion order, hence items are never compared with each
+    other."""
+
+    def __init__(self, order='min', f=lambda x: x):
+        # entries [f(x), insertion counter, x], forming a binary heap
+        self.heap = []
+        # item -> position of its entry in the heap
+        self.positions = {}
+        self.counter = 0
+
+        if order == 'min':
+            self.f = f
+        elif order == 'max':  # now item with max f(x)
+            self.f = lambda x: -f(x)  # will be popped first
+        else:
+            raise ValueError("order must be either 'min' or 'max'.")
+
+    def append(self, item):
+        """Insert item at its correct position. If an equal item is already in
+        the queue, it is replaced by item."""
+        if item in self.positions:
+            self.update(item)
+            return
+        self.heap.append([self.f(item), self.counter, item])
+        self.counter += 1
+        self.positions[item] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def extend(self, items):
+        """Insert each item in items at its correct position."""
+        for item in items:
+            self.append(item)
+
+    def update(self, item):
+        """Replace the item equal to item by item, and move it according to
+        its new f(x) value (e.g., decrease-key)."""
+        i = self.positions.pop(item)
+        entry = self.heap[i]
+        old_value = entry[0]
+        entry[0] = self.f(item)
+        entry[1] = self.counter
+        entry[2] = item
+        self.counter += 1
+        self.positions[item] = i
+        if entry[0] < old_value:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def pop(self):
+        """Pop and return the item (with min or max f(x) value)
+        depending on the order."""
+        if not self.heap:
+            raise Exception('Trying to pop from empty PriorityQueue.')
+        return self._remove(0)
+
+    def __len__(self):
+        """Return current capacity of PriorityQueue."""
+        return len(self.heap)
+
+    def __contains__(self, key):
+        """Return True if the key is in PriorityQueue."""
+        return key in self.positions
+
+    def item(self, key):
+        """Returns the item of the queue equal to key."""
+        return self.heap[self.positions[key]][2]
+
+    def __getitem__(self, key):
+        """Returns the value associated with key in PriorityQueue.
+        Raises KeyError if key is not present."""
+        try:
+            return self.heap[self.positions[key]][0]
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
+
+    def __delitem__(self, key):
+        """Delete key."""
+        try:
+            i = self.positions[key]
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
+        self._remove(i)
+
+    def _remove(self, i):
+        entry = self.heap[i]
+        del self.positions[entry[2]]
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.positions[last[2]] = i
+            if last[:2] < entry[:2]:
+                self._sift_up(i)
+            else:
+                self._sift_down(i)
+        return entry[2]
+
+    def _sift_up(self, i):
+        heap = self.heap
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) // 2
+            if heap[parent][:2] <= entry[:2]:
+                break
+            heap[i] = heap[parent]
+            self.positions[heap[i][2]] = i
+            i = parent
+        heap[i] = entry
+        self.positions[entry[2]] = i
+
+    def _sift_down(self, i):
+        heap = self.heap
+        entry = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= len(heap):
+                break
+            if child + 1 < len(heap) and heap[child + 1][:2] < heap[child][:2]:
+                child += 1
+            if entry[:2] <= heap[child][:2]:
+                break
+            heap[i] = heap[child]
+            self.positions[heap[i][2]] = i
+            i = child
+        heap[i] = entry
+        self.positions[entry[2]] = i
+
+
 # ______________________________________________________________________________
 # Useful Shorthands
 
@@ -0,0 +1,193 @@
+"""
+This file contains the collision checking backends used by Scene. A backend indexes a flat list of obstacle footprints
+and answers, for a batch of footprints, which (footprint, obstacle) pairs intersect.
+"""
+
+import numpy as np
+import shapely
+from shapely.geometry.polygon import orient
+
+from footprint import base_shape
+
+# shape id -> convex decomposition of the base shape
+_convex_pieces = {}
+
+
+class STRtreeBackend:
+    """
+    Exact intersection tests carried out by GEOS, with candidates selected by a spatial index
+    """
+
+    def __init__(self, obstacles):
+        self.tree = shapely.STRtree([obs.shape for obs in obstacles])
+
+    def query(self, footprints):
+        """
+        Returns two aligned arrays with the indices of the footprints and of the obstacles that intersect
+        """
+        shapes = np.array([footprint.shape for footprint in footprints], dtype=object)
+        return self.tree.query(shapes, predicate='intersects')
+
+
+class SATBackend:
+    """
+    Separating axis test between convex polygons, vectorized with NumPy over all the candidate pairs of a query.
+
+    Non-convex base shapes are decomposed into convex pieces once, and the pieces are moved along with the
+    footprints. Polygons that touch are considered as colliding, as with shapely's intersects.
+    """
+
+    def __init__(self, obstacles):
+        self.nobstacles = len(obstacles)
+
+        pieces = []
+        piece_obstacles = []
+        for i, obs in enumerate(obstacles):
+            for piece in convex_pieces(obs):
+                pieces.append(piece)
+                piece_obstacles.append(i)
+
+        self.piece_obstacles = np.array(piece_obstacles, dtype=np.intp)
+
+        self.vertices, self.normals, self.proj_min, self.proj_max, self.bounds = convex_arrays(pieces)
+
+    def query(self, footprints):
+        """
+        Returns two aligned arrays with the indices of the footprints and of the obstacles that intersect
+        """
+        pieces = []
+        piece_footprints = []
+        for i, footprint in enumerate(footprints):
+            for piece in convex_pieces(footprint):
+                pieces.append(piece)
+                piece_footprints.append(i)
+
+        if not pieces:
+            return np.empty((2, 0), dtype=np.intp)
+
+        vertices, normals, proj_min, proj_max, bounds = convex_arrays(pieces)
+
+        # broad phase: bounding boxes
+        overlap = (self.bounds[np.newaxis, :, 0] <= bounds[:, np.newaxis, 2]) & \
+                  (self.bounds[np.newaxis, :, 2] >= bounds[:, np.newaxis, 0]) & \
+                  (self.bounds[np.newaxis, :, 1] <= bounds[:, np.newaxis, 3]) & \
+                  (self.bounds[np.newaxis, :, 3] >= bounds[:, np.newaxis, 1])
+        queried, candidates = np.nonzero(overlap)
+
+        # narrow phase: two convex polygons are disjoint iff their projections on some edge normal are disjoint
+
+        # edge normals of the obstacle pieces
+        proj = project(vertices[queried], self.normals[candidates])
+        separated = (proj.max(axis=2) < self.proj_min[candidates]) | (proj.min(axis=2) > self.proj_max[candidates])
+
+        # edge normals of the queried pieces
+        proj = project(self.vertices[candidates], normals[queried])
+        separated_queried = (proj.max(axis=2) < proj_min[queried]) | (proj.min(axis=2) > proj_max[queried])
+
+        colliding = ~(separated.any(axis=1) | separated_queried.any(axis=1))
+
+        # several pieces of the same footprint may collide with several pieces of the same obstacle
+        pairs = np.unique(np.array(piece_footprints, dtype=np.intp)[queried[colliding]] * self.nobstacles +
+                          self.piece_obstacles[candidates[colliding]])
+        return np.array([pairs // self.nobstacles, pairs % self.nobstacles])
+
+
+BACKENDS = {
+    'strtree': STRtreeBackend,
+    'sat': SATBackend,
+}
+
+
+def edge_normals(vertices):
+    """
+    Returns the (non-normalized) normals of the edges of the polygon(s) with the given (... x n x 2) vertices
+    """
+    edges = np.roll(vertices, -1, axis=-2) - vertices
+    return np.stack([-edges[..., 1], edges[..., 0]], axis=-1)
+
+
+def convex_pieces(footprint):
+    """
+    Returns a list of (n x 2) vertex arrays of convex polygons whose union is the footprint
+    """
+    pieces = _convex_pieces.get(footprint.shape_id)
+    if pieces is None:
+        pieces = convex_decomposition(base_shape(footprint.shape_id))
+        _convex_pieces[footprint.shape_id] = pieces
+
+    if len(pieces) == 1:
+        return [footprint.vertices]
+    return [footprint.transform(piece) for piece in pieces]
+
+
+def convex_arrays(pieces):
+    """
+    Returns the arrays describing a list of convex polygons, given as (n x 2) vertex arrays: padded vertices, edge
+    normals, minimum and maximum projections of each polygon on its own edge normals, and bounding boxes.
+
+    Polygons are padded to the same number of vertices by repeating their last vertex; the resulting degenerate edges
+    have null normals, which never separate.
+    """
+    nvertices = max([len(piece) for piece in pieces], default=3)
+    vertices = np.empty((len(pieces), nvertices, 2))
+    for i, piece in enumerate(pieces):
+        vertices[i, :len(piece)] = piece
+        vertices[i, len(piece):] = piece[-1]
+
+    normals = edge_normals(vertices)
+
+    proj = project(vertices, normals)
+    bounds = np.concatenate([vertices.min(axis=1), vertices.max(axis=1)], axis=1)
+    return vertices, normals, proj.min(axis=2), proj.max(axis=2), bounds
+
+
+def project(vertices, axes):
+    """
+    Returns the (... x a x n) projections of (... x n x 2) vertices on (... x a x 2) axes
+    """
+    return axes[..., :, np.newaxis, 0] * vertices[..., np.newaxis, :, 0] + \
+           axes[..., :, np.newaxis, 1] * vertices[..., np.newaxis, :, 1]
+
+
+def is_convex(vertices):
+    edges = np.roll(vertices, -1, axis=0) - vertices
+    cross = edges[:, 0] * np.roll(edges[:, 1], -1) - edges[:, 1] * np.roll(edges[:, 0], -1)
+    return np.all(cross >= 0) or np.all(cross <= 0)
+
+
+def convex_decomposition(polygon):
+    """
+    Returns a list of (n x 2) vertex arrays of convex polygons whose union is the given polygon (without holes).
+    Non-convex polygons are triangulated by ear clipping.
+    """
+    vertices = shapely.get_coordinates(polygon.exterior)[:-1]
+    if is_convex(vertices):
+        return [vertices]
+
+    vertices = shapely.get_coordinates(orient(polygon).exterior)[:-1]
+
+    # counter-clockwise ear clipping
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    indices = list(range(len(vertices)))
+    triangles = []
+    while len(indices) > 3:
+        for k in range(len(indices)):
+            ear = (indices[k - 1], indices[k], indices[(k + 1) % len(indices)])
+            a, b, c = vertices[list(ear)]
+            if cross(a, b, c) <= 0:
+                # reflex (or degenerate) corner
+                continue
+            if any(cross(a, b, vertices[i]) >= 0 and cross(b, c, vertices[i]) >= 0 and cross(c, a, vertices[i]) >= 0
+                   for i in indices if i not in ear):
+                # another vertex lies inside the candidate ear
+                continue
+            triangles.append(np.array([a, b, c]))
+            del indices[k]
+            break
+        else:
+            raise ValueError("Unable to triangulate polygon " + polygon.wkt)
+
+    triangles.append(vertices[indices])
+    return triangles
@@ -0,0 +1,76 @@
+"""
+Compares the collision checking backends of Scene, in terms of agreement and speed, on the scene of main.py
+"""
+
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+from shapely.geometry import Polygon
+
+from footprint import Footprint
+from scene import Scene
+from collision import BACKENDS
+from cspace import CSpaceTable, world_param_shapes
+
+import pyro
+
+
+parser = argparse.ArgumentParser(description='Collision backends benchmark')
+parser.add_argument("-s", "--seed", type=int, default=0, help="RNG seed")
+parser.add_argument("-n", "--nsamples", type=int, default=1000, help="total number of world samples")
+parser.add_argument("-f", "--nfootprints", type=int, default=900, help="number of random robot footprints")
+parser.add_argument("-b", "--batch", type=int, default=9, help="number of footprints checked per call")
+parser.add_argument("--cspace_bins", type=int, default=36, help="number of heading bins of the C-space table")
+parser.add_argument("--cspace_resolution", type=float, default=0.02, help="cell side of the C-space table")
+args = parser.parse_args()
+
+O111 = ([6., 4., 0], [[0.05, 0, 0], [0, 0.05, 0], [0, 0, 0.03]], Polygon([[0, 0], [1, 0], [.5, .866]]))
+O121 = ([5.5, 6, 0], [[0.05, 0, 0], [0, 0.05, 0], [0, 0, 0.03]], Polygon([[0, 0], [2, 0], [2, 1], [0, 1]]))
+S1 = ([0.8, 0.2], [[O111], [O121]])
+
+# non-convex
+O211 = ([2., 3, 0], [[0.05, 0, 0], [0, 0.05, 0], [0, 0, 0.03]],
+        Polygon([[0, 0], [1, 0], [1, .5], [0.5, 0.25], [0, 1]]))
+O212 = ([3.6, 4.6, 0], [[0.05, 0, 0], [0, 0.05, 0], [0, 0, 0.03]], Polygon([[0, 0], [.5, 0], [.5, .5], [0, .5]]))
+O221 = ([5., 8., 0], [[0.05, 0, 0], [0, 0.05, 0], [0, 0, 0.03]], Polygon([[0, 0], [1, 0], [1, 1], [0, 1]]))
+S2 = ([.2, .8], [[O211, O212], [O221]])
+
+WORLD = [S1, S2]
+COLORS = [["#2980b9", "#7f5bb5"], ["#e67e22", "#e6bf22"]]
+
+VEHICLE_SHAPE = Polygon([[0, 0], [0.628, 0], [0.628, 0.30], [0, 0.30]])
+
+start_time = time.time()
+CSPACE_TABLE = CSpaceTable([VEHICLE_SHAPE], world_param_shapes(WORLD), args.cspace_bins, args.cspace_resolution)
+print("cspace table build: {:.3f} s, {} cells".format(time.time() - start_time, len(CSPACE_TABLE.cells)))
+
+results = {}
+for backend in list(BACKENDS) + ['cspace']:
+    # same seed, hence same worlds, for all the backends
+    pyro.set_rng_seed(args.seed)
+    start_time = time.time()
+    scene = Scene(10., 10., WORLD, args.nsamples, COLORS, collision_backend=backend, cspace_table=CSPACE_TABLE)
+    build_time = time.time() - start_time
+
+    random.seed(args.seed)
+    footprints = [Footprint(VEHICLE_SHAPE, random.uniform(1, 9), random.uniform(1, 9), random.uniform(0, 2 * math.pi))
+                  for _ in range(args.nfootprints)]
+
+    result = np.zeros((len(footprints), len(scene.worlds)), dtype=bool)
+    start_time = time.time()
+    for i in range(0, len(footprints), args.batch):
+        shape_indices, obstacle_indices = scene.collision_backend.query(footprints[i:i + args.batch])
+        result[i + shape_indices, scene.obstacle_worlds[obstacle_indices]] = True
+    query_time = time.time() - start_time
+
+    results[backend] = result
+    print("{:8s} build: {:.3f} s, query: {:.3f} ms per batch of {}, colliding pairs: {}".format(
+        backend, build_time, 1000 * query_time / math.ceil(len(footprints) / args.batch), args.batch, result.sum()))
+
+reference = results['strtree']
+for backend, result in results.items():
+    print("{:8s} missed collisions: {}, spurious collisions: {} (w.r.t. strtree)".format(
+        backend, (reference & ~result).sum(), (result & ~reference).sum()))
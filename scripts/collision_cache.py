@@ -0,0 +1,99 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+
+class CollisionCache:
+    """
+    Footprint x world matrix of memoized collision results, shared by all the worlds of a scene.
+
+    Each row stores two packed bitsets over the worlds: the worlds for which the result is known, and the worlds in
+    which the footprint collides. Rows are allocated on demand and, once the capacity is reached, the least recently
+    used row is recycled.
+
+    Rows are keyed by the base shape of the footprint and by its pose, quantized with tolerances 'xy_tol' and
+    'theta_tol'. Hence, footprints with (almost) the same pose share their results, even if they were built by
+    different expansions or by different problems on the same scene.
+    """
+
+    def __init__(self, nworlds, capacity=100000, xy_tol=1e-3, theta_tol=1e-3):
+        assert capacity > 0
+        assert xy_tol > 0 and theta_tol > 0
+
+        self.nworlds = nworlds
+        self.capacity = capacity
+
+        self.xy_tol = xy_tol
+        self.theta_tol = theta_tol
+        self.ntheta = max(1, round(2 * math.pi / theta_tol))
+
+        nbytes = (nworlds + 7) // 8
+        self.known = np.zeros((min(capacity, 1024), nbytes), dtype=np.uint8)
+        self.result = np.zeros((min(capacity, 1024), nbytes), dtype=np.uint8)
+
+        # key -> row, from the least to the most recently used
+        self.rows = OrderedDict()
+
+        # number of (footprint, world) results answered by the cache and computed from scratch, respectively
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def key(self, footprint):
+        return (footprint.shape_id,
+                round(footprint.x / self.xy_tol),
+                round(footprint.y / self.xy_tol),
+                round(footprint.theta % (2 * math.pi) / self.theta_tol) % self.ntheta)
+
+    def lookup(self, footprint):
+        """
+        Returns the (known, result) boolean vectors over all worlds for 'footprint'. Both are all-false if
+        'footprint' is not cached.
+        """
+        key = self.key(footprint)
+        row = self.rows.get(key)
+        if row is None:
+            known = np.zeros(self.nworlds, dtype=bool)
+            return known, known.copy()
+
+        self.rows.move_to_end(key)
+        return self._unpack(self.known[row]), self._unpack(self.result[row])
+
+    def update(self, footprint, known, result):
+        """
+        Stores the (known, result) boolean vectors over all worlds for 'footprint', evicting the least recently used
+        entry if needed.
+        """
+        key = self.key(footprint)
+        row = self.rows.get(key)
+        if row is None:
+            row = self._new_row()
+            self.rows[key] = row
+        else:
+            self.rows.move_to_end(key)
+
+        self.known[row] = np.packbits(known)
+        self.result[row] = np.packbits(result)
+
+    def count(self, nhits, nmisses):
+        self.hits += nhits
+        self.misses += nmisses
+
+    def _new_row(self):
+        if len(self.rows) == self.capacity:
+            _, row = self.rows.popitem(last=False)
+            return row
+
+        row = len(self.rows)
+        if row == len(self.known):
+            # grow geometrically up to the capacity
+            nrows = min(2 * len(self.known), self.capacity)
+            self.known = np.resize(self.known, (nrows, self.known.shape[1]))
+            self.result = np.resize(self.result, (nrows, self.result.shape[1]))
+        return row
+
+    def _unpack(self, bits):
+        return np.unpackbits(bits, count=self.nworlds).view(bool)
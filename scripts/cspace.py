@@ -0,0 +1,322 @@
+"""
+This file contains precomputed configuration-space obstacles, used as an optional collision backend of Scene.
+
+Whether a robot footprint collides with an obstacle footprint only depends on their relative pose. In the frame of
+the obstacle (origin at its centroid, aligned with its heading), the robot collides iff its centroid lies in the
+Minkowski sum of the obstacle and of the reflected robot, rotated by the relative heading. For each pair of (robot,
+obstacle) base shapes, and for each bin of relative headings, such a C-space obstacle is computed conservatively
+(i.e., for all the headings in the bin) and rasterized, so that a collision query becomes a grid lookup. A second
+grid marks the cells in which the robot collides with the obstacle for all the headings in the bin; only the pairs that
+fall in between the two grids (i.e., close to the boundary of the C-space obstacle) are checked exactly.
+"""
+
+import math
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import MultiPoint
+
+from collision import convex_decomposition
+from footprint import base_centroid, base_shape
+
+
+class CSpaceTable:
+    """
+    Rasterized C-space obstacles for all pairs of the given robot and obstacle base shapes.
+
+    Args:
+        robot_shapes (list of Polygons): base shapes of the robots
+        obstacle_shapes (list of Polygons): base shapes of the obstacles
+        nbins: number of bins of relative headings
+        resolution: side of the grid cells
+    """
+
+    def __init__(self, robot_shapes, obstacle_shapes, nbins=36, resolution=0.02):
+        self.nbins = nbins
+        self.resolution = resolution
+
+        # shapes are identified by their WKB, so that tables can be stored and matched against the shapes of a run
+        self.robot_wkbs = _unique_wkbs(robot_shapes)
+        self.obstacle_wkbs = _unique_wkbs(obstacle_shapes)
+
+        # one grid per (robot shape, obstacle shape, heading bin), stored back to back in 'cells' (the cells that may
+        # collide) and 'inner_cells' (the cells that certainly collide)
+        self.grid_index = np.empty((len(self.robot_wkbs), len(self.obstacle_wkbs), nbins), dtype=np.intp)
+        origins = []
+        sizes = []
+        cells = []
+        inner_cells = []
+        for i, robot_wkb in enumerate(self.robot_wkbs):
+            for j, obstacle_wkb in enumerate(self.obstacle_wkbs):
+                for b in range(nbins):
+                    robot_shape = shapely.from_wkb(robot_wkb)
+                    obstacle_shape = shapely.from_wkb(obstacle_wkb)
+                    theta_min = 2 * math.pi * b / nbins
+                    theta_max = 2 * math.pi * (b + 1) / nbins
+                    origin, grid, inner_grid = rasterize(
+                        cspace_obstacle(robot_shape, obstacle_shape, theta_min, theta_max), resolution,
+                        cspace_obstacle_inner(robot_shape, obstacle_shape, theta_min, theta_max))
+                    self.grid_index[i, j, b] = len(origins)
+                    origins.append(origin)
+                    sizes.append(grid.shape)
+                    cells.append(grid.ravel())
+                    inner_cells.append(inner_grid.ravel())
+
+        self.origins = np.array(origins)
+        self.sizes = np.array(sizes, dtype=np.intp)
+        self.starts = np.concatenate([[0], np.cumsum(self.sizes.prod(axis=1))[:-1]]).astype(np.intp)
+        self.cells = np.concatenate(cells)
+        self.inner_cells = np.concatenate(inner_cells)
+
+        self._robot_indices = {}
+        self._obstacle_indices = {}
+
+    def robot_index(self, shape_id):
+        """
+        Returns the index of the robot base shape with the given shape id, or None if the table does not cover it
+        """
+        return _index(self._robot_indices, self.robot_wkbs, shape_id)
+
+    def obstacle_index(self, shape_id):
+        """
+        Returns the index of the obstacle base shape with the given shape id, or None if the table does not cover it
+        """
+        return _index(self._obstacle_indices, self.obstacle_wkbs, shape_id)
+
+    def save(self, path):
+        np.savez_compressed(path, nbins=self.nbins, resolution=self.resolution,
+                            robot_wkbs=np.array(self.robot_wkbs), obstacle_wkbs=np.array(self.obstacle_wkbs),
+                            grid_index=self.grid_index, origins=self.origins, sizes=self.sizes, starts=self.starts,
+                            cells=np.packbits(self.cells), inner_cells=np.packbits(self.inner_cells),
+                            ncells=len(self.cells))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        table = cls.__new__(cls)
+        table.nbins = int(data['nbins'])
+        table.resolution = float(data['resolution'])
+        table.robot_wkbs = [str(wkb) for wkb in data['robot_wkbs']]
+        table.obstacle_wkbs = [str(wkb) for wkb in data['obstacle_wkbs']]
+        table.grid_index = data['grid_index']
+        table.origins = data['origins']
+        table.sizes = data['sizes']
+        table.starts = data['starts']
+        table.cells = np.unpackbits(data['cells'], count=int(data['ncells'])).view(bool)
+        # tables stored before inner grids were added have none
+        table.inner_cells = np.unpackbits(data['inner_cells'], count=int(data['ncells'])).view(bool) \
+            if 'inner_cells' in data else None
+        table._robot_indices = {}
+        table._obstacle_indices = {}
+        return table
+
+    @classmethod
+    def load_or_build(cls, path, robot_shapes, obstacle_shapes, nbins=36, resolution=0.02):
+        """
+        Loads the table stored in 'path' if it matches the given shapes and parameters; otherwise, builds it and
+        stores it in 'path'.
+        """
+        if os.path.exists(path):
+            table = cls.load(path)
+            if table.nbins == nbins and table.resolution == resolution and table.inner_cells is not None and \
+                    set(_unique_wkbs(robot_shapes)) <= set(table.robot_wkbs) and \
+                    set(_unique_wkbs(obstacle_shapes)) <= set(table.obstacle_wkbs):
+                return table
+
+        table = cls(robot_shapes, obstacle_shapes, nbins, resolution)
+        table.save(path)
+        return table
+
+
+class CSpaceBackend:
+    """
+    Collision backend answering queries by lookups in a CSpaceTable, vectorized over all the candidate pairs of a query.
+
+    Candidate pairs are the pairs whose bounding boxes intersect, selected by a spatial index. A pair is colliding if
+    the robot's centroid falls in an inner cell of the C-space obstacle, and free if it falls outside the C-space
+    obstacle; the remaining pairs are checked exactly by GEOS, so that results are the same as with STRtreeBackend.
+
+    Footprints whose base shape is not covered by the table are checked by GEOS too.
+    """
+
+    def __init__(self, obstacles, table):
+        self.table = table
+
+        self.obstacle_indices = np.array([table.obstacle_index(obs.shape_id) for obs in obstacles], dtype=object)
+        if any(i is None for i in self.obstacle_indices):
+            raise ValueError("The C-space table does not cover all the obstacle shapes of the scene")
+        self.obstacle_indices = self.obstacle_indices.astype(np.intp)
+
+        # poses of the obstacles' centroids
+        self.centers = np.array([base_centroid(obs.shape_id) + (obs.x, obs.y) for obs in obstacles]).reshape(-1, 2)
+        self.thetas = np.array([obs.theta for obs in obstacles])
+        self.cos = np.cos(self.thetas)
+        self.sin = np.sin(self.thetas)
+
+        self.shapes = np.array([obs.shape for obs in obstacles], dtype=object)
+        self.tree = shapely.STRtree(self.shapes)
+
+    def query(self, footprints):
+        """
+        Returns two aligned arrays with the indices of the footprints and of the obstacles that intersect
+        """
+        if len(footprints) == 0:
+            return np.empty((2, 0), dtype=np.intp)
+
+        robot_indices = np.array([self.table.robot_index(footprint.shape_id) for footprint in footprints],
+                                 dtype=object)
+        covered = np.array([i is not None for i in robot_indices])
+
+        # broad phase: bounding boxes
+        bounds = np.array([footprint.bounds for footprint in footprints])
+        queried, candidates = self.tree.query(shapely.box(*bounds[covered].T))
+        queried = np.flatnonzero(covered)[queried]
+
+        centers = np.array([base_centroid(footprint.shape_id) + (footprint.x, footprint.y)
+                            for footprint in footprints])
+        thetas = np.array([footprint.theta for footprint in footprints])
+        maybe, certain = self.lookup(robot_indices[queried].astype(np.intp), centers[queried], thetas[queried],
+                                     candidates)
+
+        # narrow phase: pairs close to the boundary of the C-space obstacle
+        boundary = maybe & ~certain
+        shapes = np.empty(len(footprints), dtype=object)
+        for i in np.unique(queried[boundary]):
+            shapes[i] = footprints[i].shape
+        certain[boundary] = shapely.intersects(shapes[queried[boundary]], self.shapes[candidates[boundary]])
+
+        result = np.array([queried[certain], candidates[certain]])
+        if not covered.all():
+            uncovered = np.flatnonzero(~covered)
+            uncovered_shapes = np.array([footprints[i].shape for i in uncovered], dtype=object)
+            uncovered_queried, uncovered_candidates = self.tree.query(uncovered_shapes, predicate='intersects')
+            result = np.concatenate([result, [uncovered[uncovered_queried], uncovered_candidates]], axis=1)
+        return result
+
+    def lookup(self, robot_indices, centers, thetas, obstacles):
+        """
+        Returns, for each pair of a robot pose (base shape index in the table, centroid, heading) and an obstacle,
+        whether the robot's centroid falls in the C-space obstacle, and whether it falls in an inner cell of it
+        """
+        table = self.table
+
+        # robot's centroid in the frames of the obstacles
+        d = centers - self.centers[obstacles]
+        cos = self.cos[obstacles]
+        sin = self.sin[obstacles]
+        x = cos * d[:, 0] + sin * d[:, 1]
+        y = -sin * d[:, 0] + cos * d[:, 1]
+
+        bins = np.floor((thetas - self.thetas[obstacles]) % (2 * math.pi) / (2 * math.pi) * table.nbins)
+        grids = table.grid_index[robot_indices, self.obstacle_indices[obstacles], bins.astype(np.intp) % table.nbins]
+
+        ix = np.floor((x - table.origins[grids, 0]) / table.resolution).astype(np.intp)
+        iy = np.floor((y - table.origins[grids, 1]) / table.resolution).astype(np.intp)
+        nx = table.sizes[grids, 0]
+        ny = table.sizes[grids, 1]
+
+        inside = (0 <= ix) & (ix < nx) & (0 <= iy) & (iy < ny)
+        cells = table.starts[grids[inside]] + ix[inside] * ny[inside] + iy[inside]
+        maybe = inside.copy()
+        maybe[inside] = table.cells[cells]
+        certain = np.zeros_like(inside)
+        if table.inner_cells is not None:
+            certain[inside] = table.inner_cells[cells]
+        return maybe, certain
+
+
+def cspace_obstacle(robot_shape, obstacle_shape, theta_min, theta_max):
+    """
+    Returns a polygon, in the frame of the obstacle, containing all the positions of the robot's centroid such that
+    the robot collides with the obstacle, for any relative heading of the robot in [theta_min, theta_max].
+    """
+    robot_pieces = [piece - robot_shape.centroid.coords[0] for piece in convex_decomposition(robot_shape)]
+    obstacle_pieces = [piece - obstacle_shape.centroid.coords[0] for piece in convex_decomposition(obstacle_shape)]
+
+    # vertices of the robot at the extreme headings; the convex hull of the two poses covers all intermediate headings
+    # up to the sagitta of the arcs traveled by the vertices
+    rotations = [np.array([[math.cos(t), math.sin(t)], [-math.sin(t), math.cos(t)]]) for t in (theta_min, theta_max)]
+    radius = max(np.hypot(piece[:, 0], piece[:, 1]).max() for piece in robot_pieces)
+    sagitta = radius * (1 - math.cos((theta_max - theta_min) / 2))
+
+    cobstacles = []
+    for robot_piece in robot_pieces:
+        swept = np.concatenate([robot_piece @ rotation for rotation in rotations])
+        for obstacle_piece in obstacle_pieces:
+            # Minkowski sum of two convex polygons: convex hull of the pairwise differences of their vertices
+            points = (obstacle_piece[:, np.newaxis, :] - swept[np.newaxis, :, :]).reshape(-1, 2)
+            cobstacles.append(MultiPoint(points).convex_hull)
+
+    return shapely.union_all(cobstacles).buffer(sagitta + 1e-9)
+
+
+def cspace_obstacle_inner(robot_shape, obstacle_shape, theta_min, theta_max):
+    """
+    Returns a polygon, in the frame of the obstacle, containing only positions of the robot's centroid such that the
+    robot collides with the obstacle for all relative headings in [theta_min, theta_max].
+
+    Each pair of convex pieces gives a convex C-space obstacle, which moves by at most the chord traveled by the
+    robot's vertices between the middle heading and any heading of the bin; the C-space obstacle at the middle heading,
+    eroded by this chord, is therefore contained in the C-space obstacles of all the headings of the bin.
+    """
+    robot_pieces = [piece - robot_shape.centroid.coords[0] for piece in convex_decomposition(robot_shape)]
+    obstacle_pieces = [piece - obstacle_shape.centroid.coords[0] for piece in convex_decomposition(obstacle_shape)]
+
+    theta = (theta_min + theta_max) / 2
+    rotation = np.array([[math.cos(theta), math.sin(theta)], [-math.sin(theta), math.cos(theta)]])
+    radius = max(np.hypot(piece[:, 0], piece[:, 1]).max() for piece in robot_pieces)
+    chord = 2 * radius * math.sin((theta_max - theta_min) / 4)
+
+    cobstacles = []
+    for robot_piece in robot_pieces:
+        rotated = robot_piece @ rotation
+        for obstacle_piece in obstacle_pieces:
+            points = (obstacle_piece[:, np.newaxis, :] - rotated[np.newaxis, :, :]).reshape(-1, 2)
+            cobstacles.append(MultiPoint(points).convex_hull.buffer(-chord - 1e-9))
+
+    return shapely.union_all(cobstacles)
+
+
+def rasterize(polygon, resolution, inner_polygon=None):
+    """
+    Returns the origin and a boolean (nx x ny) grid of the cells that intersect the polygon, along with a grid of the
+    cells contained in 'inner_polygon' if given
+    """
+    xmin, ymin, xmax, ymax = polygon.bounds
+    nx = int(math.ceil((xmax - xmin) / resolution)) + 1
+    ny = int(math.ceil((ymax - ymin) / resolution)) + 1
+
+    xs = xmin + resolution * np.arange(nx)
+    ys = ymin + resolution * np.arange(ny)
+    x0, y0 = np.meshgrid(xs, ys, indexing='ij')
+    cells = shapely.box(x0, y0, x0 + resolution, y0 + resolution)
+
+    shapely.prepare(polygon)
+    if inner_polygon is None:
+        return (xmin, ymin), shapely.intersects(polygon, cells)
+    shapely.prepare(inner_polygon)
+    return (xmin, ymin), shapely.intersects(polygon, cells), shapely.contains(inner_polygon, cells)
+
+
+def world_param_shapes(world_param):
+    """
+    Returns the base shapes of all the obstacles of a world's generative model
+    """
+    return [shape for _, scenarios in world_param for scenario in scenarios for _, _, shape in scenario]
+
+
+def _unique_wkbs(shapes):
+    wkbs = []
+    for shape in shapes:
+        wkb = shapely.to_wkb(shape, hex=True)
+        if wkb not in wkbs:
+            wkbs.append(wkb)
+    return wkbs
+
+
+def _index(indices, wkbs, shape_id):
+    if shape_id not in indices:
+        wkb = shapely.to_wkb(base_shape(shape_id), hex=True)
+        indices[shape_id] = wkbs.index(wkb) if wkb in wkbs else None
+    return indices[shape_id]
@@ -7,8 +7,8 @@ class DiscState(problem.State):
     Discretized state
     """
 
-    def __init__(self, footprint, x, y, theta, prev=None):
-        super().__init__(footprint, x, y, theta, prev)
+    def __init__(self, footprint, x, y, theta, prev=None, collisions=None):
+        super().__init__(footprint, x, y, theta, prev, collisions)
 
         #  hybrid-A* approximation
         self.x_cell = math.ceil(x / problem.XY_DISC)
@@ -33,12 +33,12 @@ class Problem(problem.Problem):
 
     def __init__(self, initial, goal, scene, motion_primitives,
                  delta_t, velocity, vehicle_shape,
-                 max_crash_prob, sampling_algorithm):
+                 max_crash_prob, sampling_algorithm, common_world_order=False):
         super().__init__(initial, goal, scene, motion_primitives,
                        delta_t, velocity, vehicle_shape,
-                       max_crash_prob, sampling_algorithm)
+                       max_crash_prob, sampling_algorithm, common_world_order)
 
         self.discrete = True
 
     def result(self, state, action):
-        return DiscState(action.footprint, action.x, action.y, action.theta, state)
+        return DiscState(action.footprint, action.x, action.y, action.theta, state, action.collisions)
@@ -7,8 +7,10 @@ from shapely.geometry import Polygon
 
 from aima.search import astar_search
 from rrt_search import rrt_search
+from hybrid_astar import hybrid_astar_search
+from lazy_astar import lazy_astar_search
 
-from problem import Goal, world_collides_state
+from problem import Goal
 import problem
 import disc_state_problem
 
@@ -39,7 +41,7 @@ class RobotSetting:
 
 class Experiment:
     def __init__(self, exp_type, scenes, robot_setting, max_collision_prob, search_algorithm_st, sampling_algorithm, max_iter,
-                 repetitions):
+                 repetitions, share_collision_cache=False, common_world_order=False):
         self.exp_type = exp_type
         self.scenes = scenes
         self.robot_setting = robot_setting
@@ -49,20 +51,24 @@ class Experiment:
         self.max_iter = max_iter
         self.repetitions = repetitions
 
-    def compute_true_CP(self, last_state, n_samples):
-        print("computing true cp....")
-        n_collisions = 0
-        scene = deepcopy(self.scenes['truep'])
-        witer = scene.worlds_iter()
-        sample_collision = lambda: world_collides_state(next(witer), last_state)
-
-        for _ in range(n_samples):
+        # if true, problems are built on the scenes themselves instead of on copies of them, so that collision
+        # results are reused across experiments (e.g., across sampling algorithms and thresholds)
+        self.share_collision_cache = share_collision_cache
 
-            collides = sample_collision()
-            if collides:
-                n_collisions += 1
+        # if true, all the hypothesis tests of a search draw the worlds in the same random order
+        self.common_world_order = common_world_order
 
-        return n_collisions / n_samples
+    def compute_true_CP(self, last_state, n_samples):
+        print("computing true cp....")
+        scene = self.scenes['truep']
+        footprints = []
+        state = last_state
+        while state is not None:
+            footprints.append(state.footprint)
+            state = state.prev
+        world_indices = scene.sample_world_indices(n_samples)
+        collides = scene.collides_batch(footprints, world_indices).any(axis=0)
+        return collides.sum() / n_samples
 
     def run(self):
         logdirname = self.exp_type
@@ -72,28 +78,37 @@ class Experiment:
         pyro.set_rng_seed(101)
         for i in range(self.repetitions):
             print("NOW RUNNING EXPERIMENT " + str(i))
-            scene_copy = deepcopy(self.scenes[i])
+            scene_copy = self.scenes[i] if self.share_collision_cache else deepcopy(self.scenes[i])
+            hits_before, misses_before = scene_copy.collision_check_counts()
 
-            if self.search_algorithm == 'astar':
+            if self.search_algorithm in ('astar', 'hybrid_astar', 'lazy_astar'):
                 init_state = disc_state_problem.DiscState(self.robot_setting.init_footprint, self.robot_setting.start_x,
                                                       self.robot_setting.start_y, self.robot_setting.start_theta)
 
                 problem_instance = disc_state_problem.Problem(
                     init_state, self.robot_setting.goal, scene_copy, self.robot_setting.motion_prim,
                     self.robot_setting.delta_t, self.robot_setting.velocity, self.robot_setting.vehicle_shape,
-                    self.max_collision_prob, self.sampling_algorithm)
-
-                search = lambda: astar_search(problem_instance, n_saved_explored_states=0, max_iter=self.max_iter)
-            elif self.search_algorithm == 'rrt':
+                    self.max_collision_prob, self.sampling_algorithm, self.common_world_order)
+
+                if self.search_algorithm == 'astar':
+                    search = lambda: astar_search(problem_instance, n_saved_explored_states=0, max_iter=self.max_iter)
+                elif self.search_algorithm == 'hybrid_astar':
+                    search = lambda: hybrid_astar_search(problem_instance, n_saved_explored_states=0,
+                                                         max_iter=self.max_iter)
+                else:
+                    search = lambda: lazy_astar_search(problem_instance, n_saved_explored_states=0,
+                                                       max_iter=self.max_iter)
+            elif self.search_algorithm in ('rrt', 'lazy_rrt'):
                 init_state = problem.State(self.robot_setting.init_footprint, self.robot_setting.start_x,
                                            self.robot_setting.start_y, self.robot_setting.start_theta)
 
                 problem_instance = problem.Problem(
                     init_state, self.robot_setting.goal, scene_copy, self.robot_setting.motion_prim,
                     self.robot_setting.delta_t, self.robot_setting.velocity, self.robot_setting.vehicle_shape,
-                    self.max_collision_prob, self.sampling_algorithm)
+                    self.max_collision_prob, self.sampling_algorithm, self.common_world_order)
                 search = lambda: rrt_search(problem_instance, goal_bias=0.3, max_iter=self.max_iter,
-                                            n_saved_explored_states=0)
+                                            n_saved_explored_states=0,
+                                            lazy=self.search_algorithm == 'lazy_rrt')
 
             else:
                 raise NotImplementedError()
@@ -111,11 +126,9 @@ class Experiment:
             else:
                 true_cp = self.compute_true_CP(last_node.state, 10000)
 
-            num_nominal_coll_checks = 0
-            num_actual_coll_checks = 0
-            for world in problem_instance.scene.worlds:
-                num_nominal_coll_checks += world.num_nominal_coll_checks
-                num_actual_coll_checks += world.num_actual_coll_checks
+            hits_after, misses_after = scene_copy.collision_check_counts()
+            num_actual_coll_checks = misses_after - misses_before
+            num_nominal_coll_checks = hits_after - hits_before + num_actual_coll_checks
 
             f = open("../log/" + logdirname + "/results.log", 'a+')
 
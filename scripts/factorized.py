@@ -0,0 +1,40 @@
+import numpy as np
+from scipy import stats
+
+
+class FactorizedTest:
+    """
+    Chance-constraint test for worlds made of independent subworlds. The probability that a trajectory is
+    collision-free is the product, over the subworlds, of the probability that it misses the subworld. Each factor is
+    estimated on its own pool of subworld instances, and bounded from below by a Clopper-Pearson interval at level
+    alpha / nsubworlds, so that (by the union bound) the product of the bounds is a lower bound of the probability at
+    level alpha.
+
+    Args:
+        nsubworlds: Number of independent subworlds
+        nsamples: Number of instances in the pool of each subworld
+        prob: Probability threshold to compare against.
+        alpha: Upper bound on the probability that the lower bound is above the true probability
+    """
+
+    def __init__(self, nsubworlds, nsamples, prob=0.50, alpha=0.05):
+        self.prob = prob
+
+        # lower bound of the probability of missing a subworld, as a function of the number of free instances
+        nfree = np.arange(nsamples + 1)
+        self.lower_bounds = np.zeros(nsamples + 1)
+        self.lower_bounds[1:] = stats.beta.ppf(alpha / nsubworlds, nfree[1:], nsamples - nfree[1:] + 1)
+
+    def lower_bound(self, nfree):
+        """
+        Returns the lower bound of the probability of being collision-free, given the number of free instances in the
+        pool of each subworld
+        """
+        return np.prod(self.lower_bounds[nfree])
+
+    def pr_gt(self, nfree):
+        """
+        Returns true if the probability of being collision-free is above threshold with confidence 1 - alpha, given the
+        number of free instances in the pool of each subworld
+        """
+        return self.lower_bound(nfree) >= self.prob
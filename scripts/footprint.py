@@ -1,21 +1,93 @@
+import math
+
+import numpy as np
 from shapely.affinity import translate, rotate
+from shapely.geometry import Polygon
 
 import matplotlib.pyplot as plt
 
+# base shapes that footprints are built from, indexed by their shape id, along with their vertices and centroid
+_shapes = []
+_shape_ids = {}
+
+
+def shape_id(shape):
+    """
+    Returns a small integer identifying the given base shape for the lifetime of the program
+    """
+    i = _shape_ids.get(id(shape))
+    if i is None:
+        # keep a reference to the shape, so that its id() cannot be reused
+        i = len(_shapes)
+        _shapes.append((shape, np.array(shape.exterior.coords)[:-1], np.array(shape.centroid.coords[0])))
+        _shape_ids[id(shape)] = i
+    return i
+
+
+def base_shape(i):
+    """
+    Returns the base shape with the given shape id
+    """
+    return _shapes[i][0]
+
+
+def base_centroid(i):
+    """
+    Returns the centroid of the base shape with the given shape id, which footprints are rotated around
+    """
+    return _shapes[i][2]
+
 
 class Footprint:
     """
-    Represents obstacles and vehicles
+    Represents obstacles and vehicles.
+
+    A footprint is its base shape rotated by theta around its centroid, then translated by (x, y). Only the
+    transformed vertices and the bounding box are computed upfront; the shapely geometry is built on demand.
     """
 
+    __slots__ = ('x', 'y', 'theta', 'shape_id', 'rotation', 'offset', 'vertices', 'bounds', '_shape')
+
     def __init__(self, shape, x, y, theta):
-        shape = rotate(shape, theta, origin='centroid', use_radians=True)
-        shape = translate(shape, x, y)
-        self.shape = shape
+        # the pose and the base shape identify the footprint (e.g., for caching collision results)
+        self.x = x
+        self.y = y
+        self.theta = theta
+        self.shape_id = shape_id(shape)
+
+        _, vertices, centroid = _shapes[self.shape_id]
+
+        # the pose as an affine map of the base shape coordinates: p -> p @ rotation + offset
+        cos = math.cos(theta)
+        sin = math.sin(theta)
+        self.rotation = np.array([[cos, sin], [-sin, cos]])
+        self.offset = centroid - centroid @ self.rotation + (x, y)
+
+        self.vertices = self.transform(vertices)
+        self.bounds = (*self.vertices.min(axis=0), *self.vertices.max(axis=0))
+        self._shape = None
+
+    def transform(self, points):
+        """
+        Maps (n x 2) points from the coordinates of the base shape to the coordinates of the footprint
+        """
+        return points @ self.rotation + self.offset
+
+    @property
+    def shape(self):
+        if self._shape is None:
+            shape = base_shape(self.shape_id)
+            if shape.interiors:
+                shape = rotate(shape, self.theta, origin='centroid', use_radians=True)
+                self._shape = translate(shape, self.x, self.y)
+            else:
+                self._shape = Polygon(self.vertices)
+        return self._shape
 
     def collides(self, other):
         return self.shape.intersects(other.shape)
 
     def plot(self, color):
-        xs, ys = self.shape.exterior.xy
+        xs = np.append(self.vertices[:, 0], self.vertices[0, 0])
+        ys = np.append(self.vertices[:, 1], self.vertices[0, 1])
         plt.plot(xs, ys, color, linewidth=.5)
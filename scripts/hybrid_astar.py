@@ -0,0 +1,157 @@
+"""
+This file contains an implementation of A* on discretized problems (see disc_state_problem.py) whose bookkeeping lives
+in NumPy arrays indexed by cell, instead of sets and priority queues of hashed states.
+
+Each (x_cell, y_cell, theta_cell) cell of the grid holds at most one node: the closed set, the f-values, the nodes of
+the frontier and their positions in the frontier's binary heap are all arrays over the cells, so memory is bounded by
+the size of the grid rather than by the number of generated nodes.
+"""
+
+import math
+
+import numpy as np
+
+from aima.search import Node
+from aima.utils import memoize
+
+import problem as problem_module
+
+
+class CellGrid:
+    """
+    Flat indexing of the (x_cell, y_cell, theta_cell) cells of the states of a scene
+    """
+
+    def __init__(self, scene):
+        self.nx = int(math.ceil(scene.x_max / problem_module.XY_DISC)) + 1
+        self.ny = int(math.ceil(scene.y_max / problem_module.XY_DISC)) + 1
+        # theta % (2 * pi) may round up to 2 * pi (e.g., for tiny negative headings), hence the extra cell
+        self.ntheta = int(math.floor(2 * math.pi / problem_module.THETA_DISC)) + 1
+
+    def __len__(self):
+        return self.nx * self.ny * self.ntheta
+
+    def index(self, state):
+        assert 0 <= state.x_cell < self.nx and 0 <= state.y_cell < self.ny and 0 <= state.theta_cell < self.ntheta
+        return (state.x_cell * self.ny + state.y_cell) * self.ntheta + state.theta_cell
+
+
+class CellHeap:
+    """
+    Binary min-heap of cells, keyed by f-values (ties broken by insertion order), with the position of each cell
+    stored in an array for decrease-key.
+    """
+
+    def __init__(self, ncells):
+        self.cells = []
+        self.f = np.full(ncells, np.inf)
+        self.order = np.zeros(ncells, dtype=np.int64)
+        self.positions = np.full(ncells, -1, dtype=np.intp)
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return self.positions[cell] >= 0
+
+    def push(self, cell, f):
+        """
+        Inserts the cell with the given f-value, or updates its f-value if it is already in the heap
+        """
+        self.f[cell] = f
+        self.order[cell] = self.counter
+        self.counter += 1
+        if self.positions[cell] < 0:
+            self.cells.append(cell)
+            self.positions[cell] = len(self.cells) - 1
+        self._sift_up(self.positions[cell])
+        self._sift_down(self.positions[cell])
+
+    def pop(self):
+        cells = self.cells
+        cell = cells[0]
+        last = cells.pop()
+        self.positions[cell] = -1
+        if cells:
+            cells[0] = last
+            self.positions[last] = 0
+            self._sift_down(0)
+        return cell
+
+    def _less(self, a, b):
+        return self.f[a] < self.f[b] or (self.f[a] == self.f[b] and self.order[a] < self.order[b])
+
+    def _sift_up(self, i):
+        cells = self.cells
+        cell = cells[i]
+        while i > 0:
+            parent = (i - 1) // 2
+            if not self._less(cell, cells[parent]):
+                break
+            cells[i] = cells[parent]
+            self.positions[cells[i]] = i
+            i = parent
+        cells[i] = cell
+        self.positions[cell] = i
+
+    def _sift_down(self, i):
+        cells = self.cells
+        cell = cells[i]
+        while True:
+            child = 2 * i + 1
+            if child >= len(cells):
+                break
+            if child + 1 < len(cells) and self._less(cells[child + 1], cells[child]):
+                child += 1
+            if not self._less(cells[child], cell):
+                break
+            cells[i] = cells[child]
+            self.positions[cells[i]] = i
+            i = child
+        cells[i] = cell
+        self.positions[cell] = i
+
+
+def hybrid_astar_search(problem, n_saved_explored_states=0, h=None, max_iter=float('inf')):
+    """
+    Same as aima.search.astar_search, for problems with DiscState states.
+    """
+    h = memoize(h or problem.h, 'h')
+
+    grid = CellGrid(problem.scene)
+    closed = np.zeros(len(grid), dtype=bool)
+    frontier = CellHeap(len(grid))
+    # node of each cell of the frontier
+    nodes = np.empty(len(grid), dtype=object)
+
+    node = Node(problem.initial)
+    cell = grid.index(node.state)
+    nodes[cell] = node
+    frontier.push(cell, node.path_cost + h(node))
+
+    nexplored = 0
+    explored_states = []
+
+    while frontier and nexplored < max_iter:
+        cell = frontier.pop()
+        node = nodes[cell]
+        nodes[cell] = None
+        if problem.goal_test(node.state):
+            return node, nexplored, explored_states
+        closed[cell] = True
+        if nexplored < n_saved_explored_states:
+            explored_states.append(node.state)
+        nexplored += 1
+        if nexplored % 100 == 0:
+            print("Explored nodes: " + str(nexplored))
+        for child in node.expand(problem):
+            child_cell = grid.index(child.state)
+            if closed[child_cell]:
+                continue
+            f = child.path_cost + h(child)
+            if child_cell not in frontier or f < frontier.f[child_cell]:
+                nodes[child_cell] = child
+                frontier.push(child_cell, f)
+
+    return None, nexplored, explored_states
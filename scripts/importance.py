@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+from scipy import stats
+
+from sequential_test import SequentialTest, CONTINUE, FALSE, TRUE
+
+# thresholds of the conditional tests are rounded (up) to this resolution, so that their decision tables are reused
+PROB_RESOLUTION = 1e-3
+
+
+class ImportanceTest:
+    """
+    Chance-constraint test with importance sampling. Samples are drawn from a proposal distribution concentrated on a
+    subset of the population (e.g., the worlds with an obstacle near the robot) that contains all the samples that may
+    test false, so that the likelihood ratio of every sample is the probability mass 'mass' of the subset.
+
+    The probability that the variable is false is 'mass' times the probability that it is false within the subset,
+    hence it is below 1 - prob iff the conditional probability is below (1 - prob) / mass; the latter is tested by a
+    ClopperPearsonTest on the samples of the subset. When the subset is rare, the conditional threshold is far from 1,
+    and the test needs much fewer samples than a test on the whole population.
+
+    Args:
+        prob: Probability threshold to compare against.
+        alpha: Upper bound on the probability of accepting when the probability is at most prob
+        nsamples_max: Limit on the number of samples to draw
+    """
+
+    def __init__(self, prob=0.50, alpha=0.05, nsamples_max=300):
+        self.prob = prob
+        self.alpha = alpha
+        self.nsamples_max = nsamples_max
+
+        # conditional threshold -> test
+        self.conditional_tests = {}
+
+    def pr_gt(self, sample_batch_func, mass):
+        """
+        Returns true if, according to the test, the probability that the Bernoulli random variable is true is above
+        threshold. 'sample_batch_func(n)' returns the outcomes of n samples drawn from the subset of probability 'mass'
+        outside of which the variable is always true.
+        """
+        if mass <= 1 - self.prob:
+            # even if the variable is false everywhere in the subset
+            return True
+
+        # conditional threshold, rounded up (i.e., the test is slightly conservative)
+        prob = 1 - (1 - self.prob) / mass
+        prob = min(math.ceil(prob / PROB_RESOLUTION - 1e-9) * PROB_RESOLUTION, self.prob)
+        if prob <= 0:
+            # mass is 1 - self.prob up to rounding errors
+            return True
+        test = self.conditional_tests.get(prob)
+        if test is None:
+            test = ClopperPearsonTest(prob, self.alpha, self.nsamples_max)
+            self.conditional_tests[prob] = test
+        return test.pr_gt(sample_batch_func)
+
+
+class ClopperPearsonTest(SequentialTest):
+    """
+    Sequential test accepting when the exact (Clopper-Pearson) lower confidence bound of the probability is at least
+    prob. Unlike the Z-test, it does not rely on the normal approximation, which is poor for the thresholds far from
+    1/2 and the small numbers of samples of the conditional tests.
+
+    The number of samples doubles at each checkpoint, starting from the fewest samples that can accept (all of them
+    testing true), and the significance level is split evenly among the checkpoints, so that (by the union bound) the
+    probability of accepting when the probability is at most prob is at most alpha. The test rejects as soon as the
+    upper confidence bound of the probability is below prob, or as soon as it cannot accept at the last checkpoint,
+    even if all the remaining samples test true; early rejections only lower the probability of accepting.
+
+    Args:
+        prob: Probability threshold to compare against.
+        alpha: Upper bound on the probability of accepting when the probability is at most prob
+        nsamples_max: Number of samples of the last checkpoint
+    """
+
+    def __init__(self, prob=0.50, alpha=0.05, nsamples_max=300):
+        # the first checkpoint and the number of checkpoints depend on each other
+        ncheckpoints = 1
+        while True:
+            nsamples_min = min(max(math.ceil(math.log(alpha / ncheckpoints) / math.log(prob)), 1), nsamples_max)
+            n = 1
+            while nsamples_min * 2 ** (n - 1) < nsamples_max:
+                n += 1
+            if n <= ncheckpoints:
+                break
+            ncheckpoints = n
+
+        super().__init__(nsamples_min, None)
+        self.prob = prob
+        self.alpha = alpha / ncheckpoints
+        self.nsamples_max = nsamples_max
+
+    def checkpoint(self, b):
+        return min(self.nsamples_init * 2 ** b, self.nsamples_max)
+
+    def decisions(self, k_total, k_true):
+        nsamples_max = self.nsamples_max
+        return np.select([self.lower_bound(k_total, k_true) >= self.prob,
+                          np.full(len(k_true), k_total >= nsamples_max),  # run out of samples
+                          self.upper_bound(k_total, k_true) < self.prob,
+                          self.lower_bound(nsamples_max, k_true + nsamples_max - k_total) < self.prob],  # unable to reach the threshold even when all remaining samples test true
+                         [TRUE, FALSE, FALSE, FALSE], CONTINUE)
+
+    def lower_bound(self, k_total, k_true):
+        lower_bounds = np.zeros(len(k_true))
+        some = k_true > 0
+        lower_bounds[some] = stats.beta.ppf(self.alpha, k_true[some], k_total - k_true[some] + 1)
+        return lower_bounds
+
+    def upper_bound(self, k_total, k_true):
+        upper_bounds = np.ones(len(k_true))
+        some = k_true < k_total
+        upper_bounds[some] = stats.beta.ppf(1 - self.alpha, k_true[some] + 1, k_total - k_true[some])
+        return upper_bounds
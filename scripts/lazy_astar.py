@@ -0,0 +1,62 @@
+"""
+This file contains a lazy variant of A*, in which the probabilistic collision test of a node is deferred until the node
+is popped from the frontier. Children are generated with the cheap checks only (see Problem.lazy_actions), so that the
+nodes that are never popped before the goal is found are never tested.
+
+Since the frontier holds a single node per state, the untested nodes that lose to it (i.e., the nodes of the same state
+with a higher f-value) are kept aside, and the best of them takes its place if it fails the test.
+"""
+
+from aima.search import Node
+from aima.utils import memoize, IndexedPriorityQueue
+
+
+def lazy_astar_search(problem, n_saved_explored_states=0, h=None, max_iter=float('inf')):
+    """
+    Same as aima.search.astar_search, except that a popped node is discarded if its trajectory does not satisfy the
+    chance constraint (see Problem.chance_constraint). Discarded states are not closed: the best of the other nodes
+    generated for the state replaces the discarded node in the frontier, and the state can still be reached by other
+    trajectories.
+    """
+    h = memoize(h or problem.h, 'h')
+    f = memoize(lambda n: n.path_cost + h(n), 'f')
+    node = Node(problem.initial)
+
+    frontier = IndexedPriorityQueue('min', f)
+    frontier.append(node)
+    explored = set()
+    # state -> untested nodes of the state that are not in the frontier
+    alternatives = {}
+    nexplored = 0
+    explored_states = []
+
+    while frontier and nexplored < max_iter:
+        node = frontier.pop()
+        if not problem.chance_constraint(node.state):
+            nodes = alternatives.get(node.state)
+            if nodes:
+                # nodes compare equal by state, hence the index
+                best = min(range(len(nodes)), key=lambda i: f(nodes[i]))
+                frontier.append(nodes.pop(best))
+            continue
+        if problem.goal_test(node.state):
+            return node, nexplored, explored_states
+        explored.add(node.state)
+        alternatives.pop(node.state, None)
+        if nexplored < n_saved_explored_states:
+            explored_states.append(node.state)
+        nexplored += 1
+        if nexplored % 100 == 0:
+            print("Explored nodes: " + str(nexplored))
+        for action in problem.lazy_actions(node.state):
+            child = node.child_node(problem, action)
+            if child.state not in explored and child not in frontier:
+                frontier.append(child)
+            elif child in frontier:
+                if f(child) < frontier[child]:
+                    alternatives.setdefault(child.state, []).append(frontier.item(child))
+                    frontier.update(child)
+                else:
+                    alternatives.setdefault(child.state, []).append(child)
+
+    return None, nexplored, explored_states
@@ -7,9 +7,12 @@ import matplotlib.pyplot as plt
 
 from aima.search import astar_search
 from rrt_search import rrt_search
+from hybrid_astar import hybrid_astar_search
+from lazy_astar import lazy_astar_search
 
 from footprint import Footprint
 from scene import Scene
+from cspace import CSpaceTable, world_param_shapes
 from motion import get_motion_primitives_diff_drive
 
 from problem import Goal
@@ -25,17 +28,32 @@ import pyro
 
 parser = argparse.ArgumentParser(description='Planner')
 parser.add_argument("-a", "--algorithm", type=int, choices=[
-                    0, 1], default=0, help="search algorithm to use; 0 (default) is A*, 1 is RRT")
+                    0, 1, 2, 3, 4], default=0,
+                    help="search algorithm to use; 0 (default) is A*, 1 is RRT, 2 is A* with array-backed bookkeeping "
+                         "(discretized search space only), 3 is A* testing the nodes when they are popped, 4 is RRT "
+                         "testing the children of the nearest node in order of distance to the sample")
 parser.add_argument("--nodisc", action="store_true",
                     help="no discretization of search space")
-parser.add_argument("-t", "--test", type=str, default='sprt', choices=["sprt", "ztest"], action="store", help="SPRT or Z-Test")
+parser.add_argument("-t", "--test", type=str, default='sprt',
+                    choices=["sprt", "ztest", "hypergeom", "stratified", "factorized", "importance", "exact"],
+                    action="store",
+                    help="SPRT, Z-Test, Z-Test without replacement, Z-Test stratified by scenarios, bound factorized "
+                         "over subworlds, exact binomial test on the worlds near the robot (importance sampling), or "
+                         "exact count over all the world samples")
+parser.add_argument("--common_world_order", action="store_true",
+                    help="all the hypothesis tests of the search draw the worlds in the same random order")
 parser.add_argument("-s", "--seed", type=int, default=0, help="RNG seed")
 parser.add_argument("-n", "--nsamples", type=int, default=1000, help="total number of world samples")
 parser.add_argument("--noplot", action="store_true", help="no plotting")
+parser.add_argument("-b", "--backend", type=str, default='strtree', choices=["strtree", "sat", "cspace"],
+                    help="collision checking backend")
+parser.add_argument("--cspace_table", type=str, default="cspace_table.npz",
+                    help="file storing the precomputed C-space obstacles (cspace backend only)")
 
 args = parser.parse_args()
 alg = args.algorithm
-test = args.test
+# Problem calls the Z-test "mc"
+test = "mc" if args.test == "ztest" else args.test
 pyro.set_rng_seed(args.seed)
 nsamples = args.nsamples
 assert nsamples >= 800
@@ -101,7 +119,12 @@ DELTA_T = .6
 VELOCITY = .8
 MAX_COLLISION_PROB = 0.01
 
-SCENE = Scene(X_MAX, Y_MAX, WORLD, nsamples, COLORS)
+if args.backend == 'cspace':
+    CSPACE_TABLE = CSpaceTable.load_or_build(args.cspace_table, [VEHICLE_SHAPE], world_param_shapes(WORLD))
+else:
+    CSPACE_TABLE = None
+
+SCENE = Scene(X_MAX, Y_MAX, WORLD, nsamples, COLORS, collision_backend=args.backend, cspace_table=CSPACE_TABLE)
 MOTION_PRIM = get_motion_primitives_diff_drive(
     0, 0, 0, VELOCITY, DELTA_T)
 GOAL = Goal(GOAL_X_MIN, GOAL_X_MAX, GOAL_Y_MIN,
@@ -112,17 +135,25 @@ print("Max collision prob = {}".format(MAX_COLLISION_PROB))
 if args.nodisc:
     INIT_STATE = problem.State(INIT_FOOTPRINT, START_X, START_Y, START_THETA)
     PROBLEM = problem.Problem(INIT_STATE, GOAL, SCENE, MOTION_PRIM,
-                              DELTA_T, VELOCITY, VEHICLE_SHAPE, MAX_COLLISION_PROB, test)
+                              DELTA_T, VELOCITY, VEHICLE_SHAPE, MAX_COLLISION_PROB, test, args.common_world_order)
 else:
-    INIT_STATE = disc_state_problem.State(
+    INIT_STATE = disc_state_problem.DiscState(
         INIT_FOOTPRINT, START_X, START_Y, START_THETA)
     PROBLEM = disc_state_problem.Problem(
-        INIT_STATE, GOAL, SCENE, MOTION_PRIM, DELTA_T, VELOCITY, VEHICLE_SHAPE, MAX_COLLISION_PROB, test)
+        INIT_STATE, GOAL, SCENE, MOTION_PRIM, DELTA_T, VELOCITY, VEHICLE_SHAPE, MAX_COLLISION_PROB, test,
+        args.common_world_order)
 
 if args.algorithm == 0:
     SEARCH = lambda: astar_search(PROBLEM, n_saved_explored_states=3000)
 elif args.algorithm == 1:
     SEARCH = lambda: rrt_search(PROBLEM, goal_bias=0.3, max_iter=3000, n_saved_explored_states=3000)
+elif args.algorithm == 2:
+    assert not args.nodisc
+    SEARCH = lambda: hybrid_astar_search(PROBLEM, n_saved_explored_states=3000)
+elif args.algorithm == 3:
+    SEARCH = lambda: lazy_astar_search(PROBLEM, n_saved_explored_states=3000)
+elif args.algorithm == 4:
+    SEARCH = lambda: rrt_search(PROBLEM, goal_bias=0.3, max_iter=3000, n_saved_explored_states=3000, lazy=True)
 else:
     assert(False)
 
@@ -133,21 +164,19 @@ last_node, nexplored, explored_states = SEARCH()
 end_time = time.time()
 print("Elapsed time: " + str(end_time - start_time))
 
-num_nominal_coll_checks = 0
-num_actual_coll_checks = 0
-for world in SCENE.worlds:
-    num_nominal_coll_checks += world.num_nominal_coll_checks
-    num_actual_coll_checks += world.num_actual_coll_checks
+num_cache_hits, num_actual_coll_checks = SCENE.collision_check_counts()
+num_nominal_coll_checks = num_cache_hits + num_actual_coll_checks
 print("Nominal collision checks: " + str(num_nominal_coll_checks))
 print("Actual collision checks:  " + str(num_actual_coll_checks))
 
 def true_CP(scene, last_state):
-    n_collisions = 0
-    for w in scene.worlds:
-        collides = problem.world_collides_state(w, last_state)
-        if collides:
-            n_collisions += 1
-    cp = n_collisions / len(scene.worlds)
+    footprints = []
+    state = last_state
+    while state is not None:
+        footprints.append(state.footprint)
+        state = state.prev
+    collides = scene.collides_batch(footprints).any(axis=0)
+    cp = collides.sum() / len(scene.worlds)
     return cp
 
 if last_node is not None:
@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+import shapely
+
+# cell states
+FREE = 0
+MIXED = 1
+OCCUPIED = 2
+
+
+class OccupancyGrid:
+    """
+    Raster of the scene marking each cell as free in all worlds, occupied in all worlds, or mixed.
+
+    A cell is free if no obstacle instance of any world touches it, and occupied if, in every world, it lies within
+    an obstacle instance.
+    """
+
+    def __init__(self, x_max, y_max, obstacles, obstacle_worlds, nworlds, resolution):
+        self.resolution = resolution
+        self.nx = int(math.ceil(x_max / resolution))
+        self.ny = int(math.ceil(y_max / resolution))
+
+        x0, y0 = np.meshgrid(resolution * np.arange(self.nx), resolution * np.arange(self.ny), indexing='ij')
+        cells = shapely.box(x0, y0, x0 + resolution, y0 + resolution).ravel()
+
+        tree = shapely.STRtree([obs.shape for obs in obstacles])
+
+        # number of distinct worlds with an obstacle instance touching each cell
+        cell_indices, obstacle_indices = tree.query(cells, predicate='intersects')
+        touching = count_worlds(cell_indices, obstacle_worlds[obstacle_indices], nworlds, len(cells))
+
+        # number of distinct worlds with an obstacle instance covering each cell
+        cell_indices, obstacle_indices = tree.query(cells, predicate='within')
+        covering = count_worlds(cell_indices, obstacle_worlds[obstacle_indices], nworlds, len(cells))
+
+        self.cells = np.full(len(cells), MIXED, dtype=np.int8)
+        self.cells[touching == 0] = FREE
+        self.cells[covering == nworlds] = OCCUPIED
+        self.cells = self.cells.reshape(self.nx, self.ny)
+
+    def free(self, footprint):
+        """
+        Returns true if all the cells overlapping the footprint's bounding box are free
+        """
+        xmin, ymin, xmax, ymax = footprint.bounds
+        ix0, iy0 = self.cell(xmin, ymin)
+        ix1, iy1 = self.cell(xmax, ymax)
+        return not self.cells[ix0:ix1 + 1, iy0:iy1 + 1].any()
+
+    def occupied(self, footprint):
+        """
+        Returns true if a vertex of the footprint lies in an occupied cell
+        """
+        ix, iy = self.cell(footprint.vertices[:, 0], footprint.vertices[:, 1])
+        return (self.cells[ix, iy] == OCCUPIED).any()
+
+    def cell(self, x, y):
+        ix = np.clip(np.floor_divide(x, self.resolution).astype(np.intp), 0, self.nx - 1)
+        iy = np.clip(np.floor_divide(y, self.resolution).astype(np.intp), 0, self.ny - 1)
+        return ix, iy
+
+
+def count_worlds(cell_indices, world_indices, nworlds, ncells):
+    """
+    Returns the number of distinct worlds associated to each cell by the aligned arrays of (cell, world) pairs
+    """
+    pairs = np.unique(cell_indices * nworlds + world_indices)
+    return np.bincount(pairs // nworlds, minlength=ncells)
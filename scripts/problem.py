@@ -4,6 +4,7 @@ This file contains the definition of the planning problem
 
 import math
 
+import numpy as np
 import shapely.speedups
 
 import aima
@@ -15,6 +16,9 @@ from footprint import Footprint
 
 import sprt
 import ztest
+from stratified import StratifiedTest
+from factorized import FactorizedTest
+from importance import ImportanceTest
 
 # Hybrid A* disc
 XY_DISC = 0.25
@@ -23,13 +27,17 @@ THETA_DISC = math.pi / 2
 MINSAMPLES = dict([(0.01, 300), (0.1, 128), (0.25, 110)]) # for baseline
 MAXSAMPLES = dict([(0.01, 300), (0.1, 250), (0.25, 250)])
 
+# footprints whose collision probability under the generative model is bounded by this fraction of the maximal
+# collision probability are considered collision-free (see Scene.collision_prob_bound)
+NEGLIGIBLE_CRASH_PROB = 1e-3
+
 
 class State:
     """
     The robot's configuration (i.e., 2D coordinates and orientation).
     """
 
-    def __init__(self, footprint, x, y, theta, prev = None):
+    def __init__(self, footprint, x, y, theta, prev = None, collisions = None):
         self.footprint = footprint
         self.x = x
         self.y = y
@@ -38,6 +46,10 @@ class State:
         # the immediately preceding state in the trajectory
         self.prev = prev
 
+        # packed bitset of the worlds in which the trajectory ending in this state collides, or None if not computed yet
+        # (see Problem.collisions)
+        self.collisions = collisions
+
         # avoids recomputation whenever possible with RRT
         self.actions = None
 
@@ -51,12 +63,15 @@ class State:
 
 class Action:
 
-    def __init__(self, footprint, x, y, theta):
+    def __init__(self, footprint, x, y, theta, collisions=None):
         self.footprint = footprint
         self.x = x
         self.y = y
         self.theta = theta
 
+        # packed bitset of the worlds in which the resulting trajectory collides
+        self.collisions = collisions
+
 class Goal:
 
     def __init__(self, x_min, x_max, y_min, y_max, theta_min, theta_max):
@@ -75,23 +90,28 @@ class Goal:
         self.y_center = (y_min + y_max) / 2.0
 
 
-def world_collides_state(world, state):
+def ordered_sampler(order):
     """
-    Return true iff the trajectory represented by 'state' does not collide with 'world'
+    Returns a function giving the next n worlds of 'order' (a sequence of world indices, restarted from the beginning
+    once exhausted)
     """
+    drawn = 0
 
-    curr_state = state
+    def sample_worlds(n):
+        nonlocal drawn
+        worlds = order[np.arange(drawn, drawn + n) % len(order)]
+        drawn += n
+        return worlds
 
-    while curr_state is not None:
-        if world.collides(curr_state.footprint):
-            return True
-
-        curr_state = curr_state.prev
+    return sample_worlds
 
-    return False
 
-def world_collides_new_state(world, state, new_footprint):
-    return world_collides_state(world, state) or world.collides(new_footprint)
+def cell(x, y, theta):
+    """
+    Returns the hybrid A* cell of a configuration
+    """
+    return (int(math.ceil(x / XY_DISC)), int(math.ceil(y / XY_DISC)),
+            int(math.floor(theta % (2 * math.pi) / THETA_DISC)))
 
 
 class Problem(aima.search.Problem):
@@ -101,7 +121,7 @@ class Problem(aima.search.Problem):
 
     def __init__(self, initial, goal, scene, motion_primitives,
                  delta_t, velocity, vehicle_shape, 
-                 max_crash_prob, hyptest):
+                 max_crash_prob, hyptest, common_world_order=False):
 
         super().__init__(initial, goal)
 
@@ -129,7 +149,7 @@ class Problem(aima.search.Problem):
         # the hypothesis test
         self.hyptest = hyptest
 
-        if self.hyptest == 'mc':
+        if self.hyptest in ('mc', 'hypergeom', 'stratified'):
             try:
                 self.min_samples_mc = MINSAMPLES[self.max_crash_prob]
             except KeyError:
@@ -142,6 +162,51 @@ class Problem(aima.search.Problem):
             print("Warning: using default number of max samples (250)")
             self.max_samples = 250
 
+        # length of the collision vectors of the trajectories (see footprint_collisions)
+        if self.hyptest == 'factorized':
+            self.ncollisions = len(self.scene.world_param) * len(self.scene.worlds)
+        else:
+            self.ncollisions = len(self.scene.worlds)
+
+        # if true, all the hypothesis tests of the search consume the worlds in the same random order (common random
+        # numbers), so that sibling and ancestor decisions are drawn from the same worlds
+        if common_world_order:
+            self.world_order = self.scene.sample_world_permutation()
+        else:
+            self.world_order = None
+
+        # the hypothesis test, with its decision tables built once for the whole search
+        if self.hyptest == 'sprt':
+            self.hyptest_engine = sprt.SPRT(prob=1 - self.max_crash_prob, alpha=0.05, beta=0.2,
+                                            nsamples_max=self.max_samples)
+        elif self.hyptest == 'mc':
+            self.hyptest_engine = ztest.ZTest(prob=1 - self.max_crash_prob, nsamples_init=self.min_samples_mc,
+                                              alpha=0.05, nsamples_max=self.max_samples)
+        elif self.hyptest == 'hypergeom':
+            # worlds are drawn without replacement, in a random order
+            self.hyptest_engine = ztest.FinitePopulationZTest(prob=1 - self.max_crash_prob,
+                                                              nsamples_init=self.min_samples_mc, alpha=0.05,
+                                                              nsamples_max=self.max_samples,
+                                                              population=len(self.scene.worlds))
+        elif self.hyptest == 'stratified':
+            # worlds are drawn from the strata of scenarios, in proportion to their exact likelihoods
+            self.hyptest_engine = StratifiedTest(self.scene.strata_likelihoods, prob=1 - self.max_crash_prob,
+                                                 alpha=0.05, nsamples_init=self.min_samples_mc,
+                                                 nsamples_max=self.max_samples)
+        elif self.hyptest == 'factorized':
+            # collisions are tracked per subworld instance, and the subworlds are tested as independent factors
+            self.hyptest_engine = FactorizedTest(len(self.scene.world_param), len(self.scene.worlds),
+                                                 prob=1 - self.max_crash_prob, alpha=0.05)
+        elif self.hyptest == 'importance':
+            # worlds are only drawn among the ones with obstacles near the trajectory
+            self.hyptest_engine = ImportanceTest(prob=1 - self.max_crash_prob, alpha=0.05,
+                                                 nsamples_max=self.max_samples)
+        elif self.hyptest == 'exact':
+            # no sampling: the collision fraction is counted over all the worlds of the scene
+            self.max_crashes = math.floor(self.max_crash_prob * len(self.scene.worlds) + 1e-9)
+        else:
+            raise ValueError("Unknown hypothesis test " + str(self.hyptest))
+
         shapely.speedups.enable()
 
     def actions(self, state):
@@ -159,50 +224,48 @@ class Problem(aima.search.Problem):
 
         actions = []
 
-        configs = get_new_configurations_from_primitives(
-            state.x, state.y, state.theta, self.motion_primitives)
+        # worlds in which the trajectory up to the current state already collides
+        collisions = self.collisions(state)
 
         if self.discrete:
             occupied_cells = set()
 
-        for mp_index in range(len(configs)):
-            config = configs[mp_index]
-            x = config[0]
-            y = config[1]
-            theta = config[2]
+        # 1st check: the robot remains in the map
+        candidates = self.candidates(state)
 
-            new_footprint = Footprint(self.vehicle_shape, x, y, theta)
+        # speedup: footprints that are certainly collision-free skip the collision checks
+        certainly_free = [self.certainly_free(collisions, candidate[3]) for candidate in candidates]
 
-            # speedup: avoid considering a given footprint if corresponding A* cell is already occupied
-            tentative_cell = (int(math.ceil(x / XY_DISC)), int(math.ceil(y / XY_DISC)),
-                              int(math.floor(theta % (2 * math.pi) / THETA_DISC)))
+        # speedup: the other footprints with a negligible collision probability are accepted without testing, and their
+        # collisions are only computed when needed (see collisions)
+        negligible = [not certainly_free[i] and self.negligible_crash_prob(collisions, candidates[i][3])
+                      for i in range(len(candidates))]
 
-            if self.discrete and tentative_cell in occupied_cells:
-                continue
+        # collisions of all the other candidate footprints with all the worlds, in a single vectorized call
+        checked = [i for i in range(len(candidates)) if not negligible[i] and not certainly_free[i]]
+        footprint_collisions = [None] * len(candidates)
+        for i, result in zip(checked, self.footprint_collisions([candidates[i][3] for i in checked])):
+            footprint_collisions[i] = result
+
+        for (x, y, theta, new_footprint), negligible_crash_prob, free, new_footprint_collisions in \
+                zip(candidates, negligible, certainly_free, footprint_collisions):
 
-            # 1st check: the robot remains in the map
+            # speedup: avoid considering a given footprint if corresponding A* cell is already occupied
+            tentative_cell = cell(x, y, theta)
 
-            if not self.scene.contains(new_footprint):
+            if self.discrete and tentative_cell in occupied_cells:
                 continue
 
             # 2nd check: probability of robot crashing is within threshold
-
-            witer = self.scene.worlds_iter()
-
-            # boolean function to test
-            def sample_no_collision():
-                return not world_collides_new_state(next(witer), state, new_footprint)
-
-            if self.hyptest == 'sprt':
-                no_collision = sprt.pr_gt(sample_no_collision, prob=1 - self.max_crash_prob, alpha=0.05, beta=0.2,
-                                          nsamples_max=self.max_samples)
-
-            elif self.hyptest == 'mc':
-                no_collision = ztest.pr_gt(sample_no_collision, prob=1 - self.max_crash_prob,
-                                           nsamples_init=self.min_samples_mc, alpha=0.05, nsamples_max=self.max_samples)
+            if negligible_crash_prob:
+                no_collision, new_collisions = True, None
+            else:
+                no_collision, new_collisions = self.chance_constraint_test(
+                    state, collisions, new_footprint, None if free else new_footprint_collisions)
 
             if no_collision:
-                actions.append(Action(new_footprint, x, y, theta))
+                actions.append(Action(new_footprint, x, y, theta,
+                                      None if new_collisions is None else np.packbits(new_collisions)))
 
                 if self.discrete:
                     occupied_cells.add(tentative_cell)
@@ -212,8 +275,172 @@ class Problem(aima.search.Problem):
 
         return actions
 
+    def lazy_actions(self, state):
+        """
+        Returns the candidate actions that keep the robot in the map, without testing the probability of collision
+        (see lazy_astar.lazy_astar_search); the resulting states are tested by chance_constraint.
+
+        Unlike actions, candidates leading to the same cell are all returned: any of them may fail the test, so none of
+        them can hide the others.
+        """
+        return [Action(new_footprint, x, y, theta) for x, y, theta, new_footprint in self.candidates(state)]
+
+    def chance_constraint(self, state):
+        """
+        Returns true if the probability that the trajectory ending in 'state' collides is within the threshold,
+        according to the hypothesis test, assuming that the trajectory ending in the previous state is. The collisions
+        of the trajectory are stored in the state, unless its collision probability is negligible.
+        """
+        if state.prev is None or state.collisions is not None:
+            # the initial state, or a state whose trajectory has been tested already
+            return True
+
+        collisions = self.collisions(state.prev)
+        if self.certainly_free(collisions, state.footprint):
+            footprint_collisions = None
+        elif self.negligible_crash_prob(collisions, state.footprint):
+            return True
+        else:
+            footprint_collisions = self.footprint_collisions([state.footprint])[0]
+
+        no_collision, new_collisions = self.chance_constraint_test(state.prev, collisions, state.footprint,
+                                                                   footprint_collisions)
+        state.collisions = np.packbits(new_collisions)
+        return no_collision
+
+    def candidates(self, state):
+        """
+        Returns the (x, y, theta, footprint) configurations reachable from 'state' by the motion primitives in which the
+        robot remains in the map, and does not certainly crash (i.e., in all worlds)
+        """
+        configs = get_new_configurations_from_primitives(
+            state.x, state.y, state.theta, self.motion_primitives)
+
+        candidates = []
+        for config in configs:
+            x = config[0]
+            y = config[1]
+            theta = config[2]
+
+            new_footprint = Footprint(self.vehicle_shape, x, y, theta)
+
+            if self.scene.contains(new_footprint) and not self.scene.certainly_occupied(new_footprint):
+                candidates.append((x, y, theta, new_footprint))
+
+        return candidates
+
+    def certainly_free(self, collisions, footprint):
+        """
+        Returns true if the trajectory made of a trajectory colliding with 'collisions' followed by 'footprint'
+        certainly collides with no world of the scene, i.e., if the trajectory so far is collision-free in all worlds
+        and the footprint misses the hulls of all the obstacle instances.
+        """
+        return not collisions.any() and self.scene.certainly_free(footprint)
+
+    def negligible_crash_prob(self, collisions, footprint):
+        """
+        Returns true if the trajectory so far is collision-free in all worlds, and the probability that 'footprint'
+        collides with a world drawn from the generative model is negligible. The probability is bounded analytically
+        (see Scene.collision_prob_bound) rather than checked against the worlds of the scene, hence this is never the
+        case with the 'exact' test.
+        """
+        if self.hyptest == 'exact' or collisions.any():
+            return False
+        return self.scene.collision_prob_bound(footprint) <= NEGLIGIBLE_CRASH_PROB * self.max_crash_prob
+
+    def chance_constraint_test(self, state, collisions, new_footprint, new_footprint_collisions):
+        """
+        Tests the trajectory made of the trajectory ending in 'state' (which collides with 'collisions') followed by
+        'new_footprint' (which collides with 'new_footprint_collisions', or None if it is certainly free). Returns
+        whether it passes, and its collisions.
+        """
+        if new_footprint_collisions is None:
+            return True, collisions
+
+        new_collisions = collisions | new_footprint_collisions
+        if self.hyptest == 'importance':
+            no_collision = self.importance_test(new_collisions, collisions | self.scene.near_worlds(new_footprint))
+        else:
+            no_collision = self.no_collision_test(new_collisions)
+        return no_collision, new_collisions
+
+    def no_collision_test(self, collisions):
+        """
+        Returns true if, according to the hypothesis test, the probability of sampling a world outside 'collisions'
+        (a boolean vector over the worlds) is above 1 - max_crash_prob.
+
+        With the 'exact' test, returns true iff the fraction of the scene's worlds in 'collisions' is at most
+        max_crash_prob.
+        """
+        if self.hyptest == 'exact':
+            return np.count_nonzero(collisions) <= self.max_crashes
+
+        if self.hyptest == 'factorized':
+            # number of free instances of each subworld
+            nfree = len(self.scene.worlds) - np.count_nonzero(collisions.reshape(-1, len(self.scene.worlds)), axis=1)
+            return self.hyptest_engine.pr_gt(nfree)
+
+        if self.hyptest == 'stratified':
+            # outcomes of a batch of samples, counts[h] from each stratum h
+            def sample_no_collision_strata_batch(counts):
+                return ~collisions[self.scene.sample_strata_world_indices(counts)]
+
+            return self.hyptest_engine.pr_gt(sample_no_collision_strata_batch)
+
+        if self.world_order is not None:
+            sample_worlds = ordered_sampler(self.world_order)
+        elif self.hyptest == 'hypergeom':
+            sample_worlds = ordered_sampler(self.scene.sample_world_permutation())
+        else:
+            sample_worlds = self.scene.sample_world_indices
+
+        # outcomes of a batch of samples: whether the sampled worlds are outside 'collisions'
+        def sample_no_collision_batch(n):
+            return ~collisions[sample_worlds(n)]
+
+        return self.hyptest_engine.pr_gt(sample_no_collision_batch)
+
+    def importance_test(self, collisions, near):
+        """
+        Same as no_collision_test, with the worlds only drawn among the 'near' ones (a boolean vector over the worlds),
+        which must include all the worlds in 'collisions'
+        """
+        near_worlds = np.flatnonzero(near)
+
+        # outcomes of a batch of samples among the near worlds
+        def sample_no_collision_batch(n):
+            return ~collisions[self.scene.sample_world_indices_from(near_worlds, n)]
+
+        return self.hyptest_engine.pr_gt(sample_no_collision_batch, len(near_worlds) / len(near))
+
+    def collisions(self, state):
+        """
+        Returns the boolean vector of the worlds (or subworld instances, see footprint_collisions) in which the
+        trajectory ending in 'state' collides.
+
+        The result is stored in the state as a packed bitset, so that a child only needs to OR it with the collisions
+        of its own footprint instead of walking back the whole trajectory.
+        """
+        if state.collisions is None:
+            collisions = self.footprint_collisions([state.footprint])[0]
+            if state.prev is not None:
+                collisions |= self.collisions(state.prev)
+            state.collisions = np.packbits(collisions)
+            return collisions
+
+        return np.unpackbits(state.collisions, count=self.ncollisions).view(bool)
+
+    def footprint_collisions(self, footprints):
+        """
+        Returns a boolean matrix telling, for each footprint, whether it collides with each world. With the
+        'factorized' test, worlds are replaced by subworld instances: subworld s of world i is at s * nworlds + i.
+        """
+        if self.hyptest == 'factorized':
+            return self.scene.collides_subworlds_batch(footprints).reshape(len(footprints), self.ncollisions)
+        return self.scene.collides_batch(footprints)
+
     def result(self, state, action):
-        return State(action.footprint, action.x, action.y, action.theta, state)
+        return State(action.footprint, action.x, action.y, action.theta, state, action.collisions)
 
     def goal_test(self, state):
         goal = self.goal
@@ -1,6 +1,8 @@
 import math
 import random
 
+import numpy as np
+
 from aima.search import Node
 
 
@@ -12,13 +14,12 @@ def theta_distance_sq(theta1, theta2):
     return (1.0 - math.cos(theta1 - theta2)) ** 2
 
 
-def get_closest_node(nodes_list_full, target_x, target_y, target_theta, wp=0.5, wt=0.5):
+def lavalle_distances(nodes_list, target_x, target_y, target_theta, wp=0.5, wt=0.5):
     """
-    Implementation of the distance function used by Lavalle and Kuffner.
+    Distances of the nodes to the target according to the distance function used by Lavalle and Kuffner, in which the
+    squared position and orientation distances are normalized by their maxima over the nodes. All the distances are
+    zero if either maximum vanishes.
     """
-    # do not consider nodes that cannot be expanded further
-    nodes_list = list(filter(lambda x: x.state.actions is None or len(x.state.actions) > 0, nodes_list_full))
-
     l2_dists = list(map(lambda n: l2_distance_sq(n.state.x, n.state.y, target_x, target_y), nodes_list))
     theta_dists = list(map(lambda n: theta_distance_sq(n.state.theta, target_theta), nodes_list))
 
@@ -26,21 +27,156 @@ def get_closest_node(nodes_list_full, target_x, target_y, target_theta, wp=0.5,
     max_theta_dist = max(theta_dists)
 
     if max_theta_dist < 1e-5 or max_l2_dist < 1e-5:
-        return nodes_list[0]
+        return [0.0] * len(nodes_list)
 
     wpn = wp / max_l2_dist
     wtn = wt / max_theta_dist
 
-    dists = list(map(lambda i: wpn * l2_dists[i] + wtn * theta_dists[i], range(len(nodes_list))))
+    return list(map(lambda i: wpn * l2_dists[i] + wtn * theta_dists[i], range(len(nodes_list))))
+
+
+def get_closest_node(nodes_list_full, target_x, target_y, target_theta, wp=0.5, wt=0.5):
+    """
+    Implementation of the distance function used by Lavalle and Kuffner.
+    """
+    # do not consider nodes that cannot be expanded further
+    nodes_list = list(filter(lambda x: x.state.actions is None or len(x.state.actions) > 0, nodes_list_full))
+
+    dists = lavalle_distances(nodes_list, target_x, target_y, target_theta, wp, wt)
 
     index_min_dist = min(range(len(nodes_list)), key=lambda i: dists[i])
 
     return nodes_list[index_min_dist]
 
 
-def rrt_search(problem, max_iter=float('inf'), goal_bias=0.2, n_saved_explored_states=0):
+def steer_lazy(problem, node, target_x, target_y, target_theta, wp=0.5, wt=0.5):
+    """
+    Returns the child of 'node' closest to the target whose trajectory satisfies the chance constraint, or None if
+    there is none. The children are tested in order of distance to the target until the first feasible one, instead
+    of all of them.
+
+    The actions of the node that remain to be extended are cached in node.state.actions: they are generated untested
+    (see Problem.lazy_actions), the actions that fail the test are removed, and the collisions of those that pass are
+    stored in them, so that each action is tested at most once.
+    """
+    state = node.state
+    if state.actions is None:
+        state.actions = problem.lazy_actions(state)
+    if not state.actions:
+        return None
+
+    children = [node.child_node(problem, action) for action in state.actions]
+    dists = lavalle_distances(children, target_x, target_y, target_theta, wp, wt)
+
+    infeasible = []
+    closest = None
+    for i in sorted(range(len(children)), key=lambda i: dists[i]):
+        child = children[i]
+        if problem.chance_constraint(child.state):
+            state.actions[i].collisions = child.state.collisions
+            closest = child
+            break
+        infeasible.append(state.actions[i])
+
+    state.actions = [action for action in state.actions if action not in infeasible]
+    return closest
+
+
+class NodeIndex:
+    """
+    Incremental index of the RRT nodes that can still be expanded, for nearest-node queries with the distance function
+    of get_closest_node.
+
+    The poses of the nodes are stored in NumPy arrays that grow by doubling, so that a query is a single vectorized
+    pass over them. Removed nodes (i.e., the nodes whose states have no actions left) are masked out, and the arrays are
+    compacted once half of their entries are removed; the order of the nodes is preserved, so that ties are broken as in
+    get_closest_node.
+    """
+
+    def __init__(self, capacity=1024):
+        self.nodes = np.empty(capacity, dtype=object)
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.theta = np.empty(capacity)
+        self.active = np.zeros(capacity, dtype=bool)
+        # number of entries in use, and number of removed entries among them
+        self.size = 0
+        self.nremoved = 0
+        # id of a node -> position of its entry
+        self.positions = {}
+
+    def __len__(self):
+        return self.size - self.nremoved
+
+    def append(self, node):
+        if self.size == len(self.nodes):
+            self._resize(2 * len(self.nodes))
+        i = self.size
+        self.nodes[i] = node
+        self.x[i] = node.state.x
+        self.y[i] = node.state.y
+        self.theta[i] = node.state.theta
+        self.active[i] = True
+        self.positions[id(node)] = i
+        self.size += 1
+
+    def remove(self, node):
+        i = self.positions.pop(id(node), None)
+        if i is None:
+            return
+        self.active[i] = False
+        self.nodes[i] = None
+        self.nremoved += 1
+        if 2 * self.nremoved > self.size:
+            self._compact()
+
+    def closest(self, target_x, target_y, target_theta, wp=0.5, wt=0.5):
+        """
+        Returns the node closest to the target, or None if the index is empty
+        """
+        if len(self) == 0:
+            return None
+        n = self.size
+        active = self.active[:n]
+        l2_dists = (self.x[:n] - target_x) ** 2 + (self.y[:n] - target_y) ** 2
+        theta_dists = (1.0 - np.cos(self.theta[:n] - target_theta)) ** 2
+
+        max_l2_dist = l2_dists[active].max()
+        max_theta_dist = theta_dists[active].max()
+
+        if max_theta_dist < 1e-5 or max_l2_dist < 1e-5:
+            return self.nodes[np.argmax(active)]
+
+        dists = (wp / max_l2_dist) * l2_dists + (wt / max_theta_dist) * theta_dists
+        dists[~active] = np.inf
+        return self.nodes[np.argmin(dists)]
+
+    def _resize(self, capacity):
+        for name in ('nodes', 'x', 'y', 'theta', 'active'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _compact(self):
+        keep = np.flatnonzero(self.active[:self.size])
+        for name in ('nodes', 'x', 'y', 'theta', 'active'):
+            array = getattr(self, name)
+            array[:len(keep)] = array[keep]
+        self.nodes[len(keep):self.size] = None
+        self.active[len(keep):self.size] = False
+        self.size = len(keep)
+        self.nremoved = 0
+        self.positions = {id(node): i for i, node in enumerate(self.nodes[:self.size])}
+
+
+def rrt_search(problem, max_iter=float('inf'), goal_bias=0.2, n_saved_explored_states=0, lazy=False):
     """A simple rrt algorithm implemented with the use of motion primitives and using the search
-    framework of the AIMA book"""
+    framework of the AIMA book
+
+    With lazy steering, the children of the nearest node are tested in order of distance to the random sample until
+    the first feasible one (see steer_lazy), instead of testing all of them and keeping the closest.
+    """
 
     # initial node
     n_new = Node(problem.initial)
@@ -48,6 +184,10 @@ def rrt_search(problem, max_iter=float('inf'), goal_bias=0.2, n_saved_explored_s
     # list containing all the rrt nodes computed so far
     rrt = [n_new]
 
+    # the rrt nodes that can still be expanded
+    index = NodeIndex()
+    index.append(n_new)
+
     it = 0
 
     while it < max_iter:
@@ -65,13 +205,29 @@ def rrt_search(problem, max_iter=float('inf'), goal_bias=0.2, n_saved_explored_s
             y_sample = random.random() * problem.scene.y_max
             theta_sample = random.random() * 2.0 * math.pi
 
-        n_near = get_closest_node(rrt, x_sample, y_sample, theta_sample, wp=0.5, wt=0.5)
+        n_near = index.closest(x_sample, y_sample, theta_sample, wp=0.5, wt=0.5)
+
+        if n_near is None:
+            # no node can be expanded any further
+            break
+
+        if lazy:
+            n_closest = steer_lazy(problem, n_near, x_sample, y_sample, theta_sample, wp=0.5, wt=0.5)
+            if n_closest is not None:
+                n_new = n_closest
+                rrt.append(n_new)
+                index.append(n_new)
+        else:
+            children = n_near.expand(problem)
 
-        children = n_near.expand(problem)
+            if len(children) > 0:
+                n_new = get_closest_node(children, x_sample, y_sample, theta_sample, wp=0.5, wt=0.5)
+                rrt.append(n_new)
+                index.append(n_new)
 
-        if len(children) > 0:
-            n_new = get_closest_node(children, x_sample, y_sample, theta_sample, wp=0.5, wt=0.5)
-            rrt.append(n_new)
+        # do not consider nodes that cannot be expanded further
+        if n_near.state.actions is not None and len(n_near.state.actions) == 0:
+            index.remove(n_near)
 
         it += 1
 
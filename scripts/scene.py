@@ -1,6 +1,16 @@
+import math
+
+import numpy as np
 import pyro.distributions as dist
+import shapely
 import torch
-from shapely.geometry import Polygon
+from shapely.geometry import MultiPoint
+
+from collision import BACKENDS
+from collision_cache import CollisionCache
+from cspace import CSpaceBackend
+from footprint import base_centroid
+from occupancy_grid import OccupancyGrid
 from world import gen_world
 
 
@@ -9,26 +19,265 @@ class Scene:
     Global, deterministic settings
     """
 
-    def __init__(self, x_max, y_max, world_param, nsamples, subworld_colors):
+    def __init__(self, x_max, y_max, world_param, nsamples, subworld_colors, collision_backend='strtree',
+                 cspace_table=None, cache_capacity=100000, cache_xy_tol=1e-3, cache_theta_tol=1e-3,
+                 grid_resolution=0.25):
         self.x_max = x_max
         self.y_max = y_max
-        self.scene_polygon = Polygon([[0, 0], [x_max, 0], [x_max, y_max], [0, y_max]])
 
         self.nsamples = nsamples
         self.world_param = world_param
         self.worlds = [gen_world(self.world_param) for _ in range(self.nsamples)]
         self.world_sampler = dist.Categorical(torch.ones(len(self.worlds)))
 
+        # Gaussian models of the obstacles' poses, for bounding the collision probabilities (see collision_prob_bound):
+        # for each obstacle of each scenario of each subworld, the probability of its scenario, the mean position of its
+        # centroid, the standard deviation of its position along the direction of largest variance, and the radius of
+        # its shape around its centroid
+        weights = []
+        centers = []
+        sigmas = []
+        radii = []
+        for likelihoods, scenarios in world_param:
+            for likelihood, scenario in zip(likelihoods, scenarios):
+                for g_mean, g_cov, shape in scenario:
+                    centroid = np.array(shape.centroid.coords[0])
+                    weights.append(likelihood / sum(likelihoods))
+                    centers.append(centroid + g_mean[:2])
+                    sigmas.append(math.sqrt(max(np.linalg.eigvalsh(np.array(g_cov)[:2, :2]).max(), 0)))
+                    radii.append(np.hypot(*(np.array(shape.exterior.coords) - centroid).T).max())
+        self.obstacle_model_weights = np.array(weights)
+        self.obstacle_model_centers = np.array(centers).reshape(-1, 2)
+        self.obstacle_model_sigmas = np.array(sigmas)
+        self.obstacle_model_radii = np.array(radii)
+
+        # strata of the worlds: the combinations of the scenarios of their subworlds, with their exact likelihoods
+        scenario_likelihoods = [np.array(likelihoods) / sum(likelihoods) for likelihoods, _ in world_param]
+        strata = {}
+        world_strata = []
+        for world in self.worlds:
+            scenarios = tuple(int(subworld.scenario_index) for subworld in world.subworlds)
+            world_strata.append(strata.setdefault(scenarios, len(strata)))
+        self.world_strata = np.array(world_strata, dtype=np.intp)
+        self.strata_likelihoods = np.array([np.prod([likelihoods[i] for likelihoods, i in
+                                                     zip(scenario_likelihoods, scenarios)]) for scenarios in strata])
+
+        # worlds sorted by stratum, with the position of the first world of each stratum and the size of each stratum
+        self.strata_worlds = np.argsort(self.world_strata, kind='stable')
+        self.strata_sizes = np.bincount(self.world_strata, minlength=len(strata))
+        self.strata_starts = np.concatenate([[0], np.cumsum(self.strata_sizes)[:-1]]).astype(np.intp)
+
+        # flat view of all the obstacle instances of all the worlds, indexed by a single collision backend
+        self.obstacles = []
+        obstacle_worlds = []
+        obstacle_subworlds = []
+        for world_index, world in enumerate(self.worlds):
+            for s, subworld in enumerate(world.subworlds):
+                for obs in subworld.obstacles:
+                    self.obstacles.append(obs)
+                    obstacle_worlds.append(world_index)
+                    obstacle_subworlds.append(s)
+        self.obstacle_worlds = np.array(obstacle_worlds, dtype=np.intp)
+        self.obstacle_subworlds = np.array(obstacle_subworlds, dtype=np.intp)
+        if collision_backend == 'cspace':
+            # precomputed configuration-space obstacles (see cspace.CSpaceTable)
+            self.collision_backend = CSpaceBackend(self.obstacles, cspace_table)
+        else:
+            self.collision_backend = BACKENDS[collision_backend](self.obstacles)
+
+        # spatial index of the obstacle instances, for finding the worlds with obstacles near a footprint (shared with
+        # the collision backend, if it has one)
+        self.obstacle_tree = getattr(self.collision_backend, 'tree', None)
+        if self.obstacle_tree is None:
+            self.obstacle_tree = shapely.STRtree([obs.shape for obs in self.obstacles])
+
+        # conservative bounds of the obstacles: for each obstacle of each scenario of each subworld, the convex hull of
+        # all its sampled instances
+        instances = {}
+        for world in self.worlds:
+            for s, subworld in enumerate(world.subworlds):
+                for j, obs in enumerate(subworld.obstacles):
+                    instances.setdefault((s, int(subworld.scenario_index), j), []).append(obs.vertices)
+        self.obstacle_hulls = np.array([MultiPoint(np.concatenate(vertices)).convex_hull
+                                        for vertices in instances.values()], dtype=object)
+        self.obstacle_hull_bounds = shapely.bounds(self.obstacle_hulls).reshape(-1, 4)
+        shapely.prepare(self.obstacle_hulls)
+
+        # cells that are free in all worlds, occupied in all worlds, or mixed (None disables the grid)
+        if grid_resolution is None:
+            self.occupancy_grid = None
+        else:
+            self.occupancy_grid = OccupancyGrid(x_max, y_max, self.obstacles, self.obstacle_worlds, len(self.worlds),
+                                                grid_resolution)
+
+        # memoized footprint x world collision results, shared by all the problems built on this scene
+        self.collision_cache = CollisionCache(len(self.worlds), cache_capacity, cache_xy_tol, cache_theta_tol)
+
+        # same, for the subworld instances (i.e., subworld s of world i), built on first use (see collides_subworlds_batch)
+        self.subworld_collision_cache = None
+        self.cache_params = (cache_capacity, cache_xy_tol, cache_theta_tol)
+
         self.subworld_colors = subworld_colors
         assert len(world_param) == len(subworld_colors)
 
-    def worlds_iter(self):
+    def world_indices_iter(self):
         while True:
-            i = self.world_sampler.sample()
+            yield int(self.world_sampler.sample())
+
+    def sample_world_indices(self, n):
+        """
+        Returns an array of n indices of worlds sampled (with replacement) from the world sampler
+        """
+        return self.world_sampler.sample((n,)).numpy()
+
+    def sample_world_indices_from(self, world_indices, n):
+        """
+        Returns an array of n indices of worlds sampled (with replacement) from the given ones
+        """
+        return world_indices[torch.randint(len(world_indices), (n,)).numpy()]
+
+    def sample_strata_world_indices(self, counts):
+        """
+        Returns an array of indices of worlds sampled (with replacement) from the strata: counts[h] from each stratum
+        h, stratum after stratum
+        """
+        strata = np.repeat(np.arange(len(counts)), counts)
+        offsets = (torch.rand(len(strata)).numpy() * self.strata_sizes[strata]).astype(np.intp)
+        return self.strata_worlds[self.strata_starts[strata] + np.minimum(offsets, self.strata_sizes[strata] - 1)]
+
+    def sample_world_permutation(self):
+        """
+        Returns the indices of all the worlds in a random order, for sampling them without replacement
+        """
+        return torch.randperm(len(self.worlds)).numpy()
+
+    def worlds_iter(self):
+        for i in self.world_indices_iter():
             yield self.worlds[i]
 
+    def near_worlds(self, footprint):
+        """
+        Returns a boolean vector telling, for each world, whether it has an obstacle instance whose bounding box
+        overlaps the footprint's bounding box; worlds the footprint collides with are always near
+        """
+        near = np.zeros(len(self.worlds), dtype=bool)
+        near[self.obstacle_worlds[self.obstacle_tree.query(shapely.box(*footprint.bounds))]] = True
+        return near
+
+    def collides_batch(self, footprints, world_indices=None):
+        """
+        Returns a boolean matrix (footprints x worlds) telling whether each footprint collides with each world (or with
+        each world in 'world_indices').
+
+        Results are memoized in the scene's collision cache, and all the missing ones are computed by a single query
+        of the collision backend.
+        """
+        return self._collides_batch(footprints, self.collision_cache, self.obstacle_worlds, world_indices)
+
+    def collides_subworlds_batch(self, footprints):
+        """
+        Returns a boolean array (footprints x subworlds x worlds) telling whether each footprint collides with each
+        subworld of each world. Results are memoized in a collision cache of their own.
+        """
+        nsubworlds = len(self.world_param)
+        if self.subworld_collision_cache is None:
+            self.subworld_collision_cache = CollisionCache(nsubworlds * len(self.worlds), *self.cache_params)
+
+        result = self._collides_batch(footprints, self.subworld_collision_cache,
+                                      self.obstacle_subworlds * len(self.worlds) + self.obstacle_worlds)
+        return result.reshape(len(footprints), nsubworlds, len(self.worlds))
+
+    def collision_check_counts(self):
+        """
+        Returns the numbers of collision results answered by the collision caches and computed from scratch
+        """
+        caches = [cache for cache in (self.collision_cache, self.subworld_collision_cache) if cache is not None]
+        return sum(cache.hits for cache in caches), sum(cache.misses for cache in caches)
+
+    def _collides_batch(self, footprints, cache, obstacle_columns, columns=None):
+        """
+        Returns a boolean matrix (footprints x columns) telling whether each footprint collides with the obstacles
+        mapped to each column of 'cache' (or to each column in 'columns') by 'obstacle_columns'
+        """
+        ncolumns = cache.nworlds
+
+        requested = np.zeros(ncolumns, dtype=bool)
+        if columns is None:
+            requested[:] = True
+        else:
+            requested[columns] = True
+
+        known = np.empty((len(footprints), ncolumns), dtype=bool)
+        result = np.empty((len(footprints), ncolumns), dtype=bool)
+        for i, footprint in enumerate(footprints):
+            known[i], result[i] = cache.lookup(footprint)
+
+        missing = requested & ~known
+        nmissing = int(missing.sum())
+        cache.count(len(footprints) * int(requested.sum()) - nmissing, nmissing)
+
+        if nmissing > 0:
+            rows = np.flatnonzero(missing.any(axis=1))
+
+            row_indices, obstacle_indices = self.collision_backend.query([footprints[i] for i in rows])
+
+            new_result = np.zeros((len(rows), ncolumns), dtype=bool)
+            new_result[row_indices, obstacle_columns[obstacle_indices]] = True
+
+            result[rows] = np.where(missing[rows], new_result, result[rows])
+            known[rows] |= missing[rows]
+            for i in rows:
+                cache.update(footprints[i], known[i], result[i])
+
+        if columns is None:
+            return result
+        return result[:, columns]
+
+    def certainly_free(self, footprint):
+        """
+        Returns true if the footprint only overlaps free cells of the occupancy grid, or if it misses the hulls of
+        all the obstacle instances; in both cases, it collides with no world
+        """
+        if self.occupancy_grid is not None and self.occupancy_grid.free(footprint):
+            return True
+
+        xmin, ymin, xmax, ymax = footprint.bounds
+        bounds = self.obstacle_hull_bounds
+        overlap = (bounds[:, 0] <= xmax) & (bounds[:, 2] >= xmin) & (bounds[:, 1] <= ymax) & (bounds[:, 3] >= ymin)
+        if not overlap.any():
+            return True
+        return not shapely.intersects(self.obstacle_hulls[overlap], footprint.shape).any()
+
+    def collision_prob_bound(self, footprint):
+        """
+        Returns an upper bound on the probability that the footprint collides with a world drawn from the generative
+        model (rather than from the worlds of the scene).
+
+        An obstacle can only reach the footprint if its centroid comes within the sum of their radii of the footprint's
+        centroid. Since the position of the obstacle is Gaussian, the probability that it moves by d or more from its
+        mean is at most exp(-d^2 / (2 sigma^2)), with sigma^2 the largest variance of the position; the bounds of all
+        the obstacles are summed, weighted by the probabilities of their scenarios.
+        """
+        center = base_centroid(footprint.shape_id) + (footprint.x, footprint.y)
+        radius = np.hypot(*(footprint.vertices - center).T).max()
+
+        d = np.hypot(*(self.obstacle_model_centers - center).T) - self.obstacle_model_radii - radius
+        reach = d <= 0
+        far = ~reach & (self.obstacle_model_sigmas > 0)
+        bounds = reach.astype(float)
+        bounds[far] = np.exp(-0.5 * (d[far] / self.obstacle_model_sigmas[far]) ** 2)
+        return min(float(np.dot(self.obstacle_model_weights, bounds)), 1.0)
+
+    def certainly_occupied(self, footprint):
+        """
+        Returns true if the footprint touches a cell of the occupancy grid that is occupied in all worlds, hence it
+        collides with all worlds
+        """
+        return self.occupancy_grid is not None and self.occupancy_grid.occupied(footprint)
+
     def contains(self, footprint):
-        return self.scene_polygon.contains(footprint.shape)
+        xmin, ymin, xmax, ymax = footprint.bounds
+        return 0 <= xmin and xmax <= self.x_max and 0 <= ymin and ymax <= self.y_max
 
     def plot(self):
         for world in self.worlds:
@@ -0,0 +1,97 @@
+"""
+This file contains the base class of the precompiled sequential hypothesis tests (see sprt.SPRT and ztest.ZTest).
+
+A sequential test draws a first batch of samples, then further batches until it decides. Since its parameters are
+fixed, the sample count reached after each batch (a checkpoint) is known in advance, and so is the decision taken at
+that checkpoint for every possible number of samples that test true. These decisions are tabulated once, so that
+running the test only requires counting successes and looking them up.
+"""
+
+import numpy as np
+
+# decisions at a checkpoint
+CONTINUE = -1
+FALSE = 0
+TRUE = 1
+
+
+class SequentialTest:
+    """
+    Tabulated sequential test. Subclasses define the sample count of each checkpoint and the decisions taken there.
+    """
+
+    def __init__(self, nsamples_init, nsamples_per_batch):
+        self.nsamples_init = nsamples_init
+        self.nsamples_per_batch = nsamples_per_batch
+
+        # for each checkpoint, the decision as a function of the number of samples that test true; tables are built on
+        # demand, since tests with no limit on the number of samples have no last checkpoint
+        self.tables = []
+
+    def checkpoint(self, b):
+        """
+        Returns the number of samples drawn at the end of batch b
+        """
+        return self.nsamples_init + b * self.nsamples_per_batch
+
+    def decide(self, b, k_true):
+        """
+        Returns the decision (CONTINUE, FALSE or TRUE) at the end of batch b, after k_true samples tested true
+        """
+        while b >= len(self.tables):
+            k_total = self.checkpoint(len(self.tables))
+            self.tables.append(self.decisions(k_total, np.arange(k_total + 1)).astype(np.int8))
+        return self.tables[b][k_true]
+
+    def decisions(self, k_total, k_true):
+        """
+        Returns the decisions after k_total samples, for the vector of numbers of samples that test true 'k_true'
+        """
+        raise NotImplementedError
+
+    def pr_gt(self, sample_batch_func):
+        """
+        Returns true if, according to the test, the probability that the Bernoulli random variable is true is above
+        threshold. 'sample_batch_func(n)' returns the outcomes (a sequence of booleans) of n samples.
+        """
+        k_total = 0
+        k_true = 0
+        b = 0
+        while True:
+            k_next = self.checkpoint(b)
+            k_true += int(np.count_nonzero(sample_batch_func(k_next - k_total)))
+            k_total = k_next
+
+            decision = self.decide(b, k_true)
+            if decision != CONTINUE:
+                return decision == TRUE
+            b += 1
+
+
+def pr_gt_many(tests, sample_batch_func):
+    """
+    Runs several tests (e.g., with different probability thresholds) on a single stream of samples, and returns the
+    list of their results. Each sample is drawn once and is shared by all the tests still undecided.
+    """
+    results = [None] * len(tests)
+    batches = [0] * len(tests)
+
+    # number of samples that test true among the first k samples of the stream, for each k
+    counts = [0]
+
+    while any(result is None for result in results):
+        undecided = [i for i, result in enumerate(results) if result is None]
+        k_total = min(tests[i].checkpoint(batches[i]) for i in undecided)
+
+        if k_total >= len(counts):
+            outcomes = sample_batch_func(k_total - len(counts) + 1)
+            counts.extend((counts[-1] + np.cumsum(np.asarray(outcomes, dtype=np.intp))).tolist())
+
+        for i in undecided:
+            if tests[i].checkpoint(batches[i]) == k_total:
+                decision = tests[i].decide(batches[i], counts[k_total])
+                if decision != CONTINUE:
+                    results[i] = decision == TRUE
+                batches[i] += 1
+
+    return results
@@ -0,0 +1,94 @@
+import math
+
+import numpy as np
+
+from ztest import ZTABLE
+
+
+class StratifiedTest:
+    """
+    Sequential Z-test on a stratified sample. The population is partitioned into strata of known probabilities (e.g.,
+    the worlds of a scene grouped by the scenarios of their subworlds), each batch is split among the strata in
+    proportion to their probabilities, and the probability that the Bernoulli random variable is true is estimated
+    as the weighted average of the proportions observed in the strata. Since the variance between strata does not
+    contribute to the variance of the estimate, the test can stop earlier than the plain Z-test on multimodal
+    populations.
+
+    The probability mass missing from 'weights' (e.g., of strata with no world in the scene) counts as false outcomes.
+
+    Args:
+        weights: Probabilities of the strata, summing up to at most 1
+        prob: Probability threshold to compare against.
+        alpha: Significance level, one of the levels in ztest.ZTABLE
+        nsamples_init: Number of samples of the first batch
+        nsamples_per_batch: Number of samples of the subsequent batches
+        nsamples_max: Limit on the number of samples to draw
+        nsamples_min_stratum: Number of samples drawn from each stratum in the first batch
+    """
+
+    def __init__(self, weights, prob=0.50, alpha=0.05, nsamples_init=30, nsamples_per_batch=10, nsamples_max=300,
+                 nsamples_min_stratum=2):
+        if alpha not in ZTABLE:
+            raise ValueError("Significane level %f is not supported" % alpha)
+
+        self.weights = np.asarray(weights, dtype=float)
+        self.fractions = self.weights / self.weights.sum()
+        self.alpha = alpha
+        self.z = ZTABLE[alpha]
+        self.prob = prob
+        # as with the Z-test, the all-True situation imposes a lower bound on the number of samples needed
+        nsamples_min = math.ceil(math.log(1 / alpha) / (1 - prob))
+        self.nsamples_init = max(nsamples_init, nsamples_min)
+        self.nsamples_per_batch = nsamples_per_batch
+        self.nsamples_max = max(nsamples_max, self.nsamples_init)
+        self.nsamples_min_stratum = nsamples_min_stratum
+
+    def pr_gt(self, sample_strata_batch_func):
+        """
+        Returns true if, according to the test, the probability that the Bernoulli random variable is true is above
+        threshold. 'sample_strata_batch_func(counts)' returns the outcomes (a sequence of booleans) of counts[h]
+        samples drawn from each stratum h, stratum after stratum.
+        """
+        nstrata = len(self.weights)
+
+        # number of samples drawn so far, and number of samples that test true, in each stratum
+        k_total = np.zeros(nstrata, dtype=np.intp)
+        k_true = np.zeros(nstrata, dtype=np.intp)
+
+        nsamples = self.nsamples_init
+        while True:
+            # proportional allocation of the samples drawn so far
+            target = np.maximum(np.ceil(self.fractions * nsamples).astype(np.intp), self.nsamples_min_stratum)
+            counts = np.maximum(target - k_total, 0)
+            outcomes = np.asarray(sample_strata_batch_func(counts), dtype=bool)
+            k_true += np.bincount(np.repeat(np.arange(nstrata), counts), weights=outcomes,
+                                  minlength=nstrata).astype(np.intp)
+            k_total += counts
+
+            estimate, se = self.estimate(k_total, k_true)
+            if self.prob <= estimate - self.z * se:
+                return True  # reject H0
+            if k_total.sum() >= self.nsamples_max:  # run out of samples
+                return False  # accept H0
+            if self.prob > estimate + self.z * se:  # the threshold is out of reach
+                return False  # accept H0
+
+            nsamples += self.nsamples_per_batch
+
+    def estimate(self, k_total, k_true):
+        """
+        Returns the stratified estimate of the probability and its standard error
+        """
+        estimate = np.dot(self.weights, k_true / k_total)
+
+        nsamples = k_total.sum()
+        nsamples_false = nsamples - k_true.sum()
+        if nsamples_false == 0:
+            # beware of an all-True situation, as in ztest.calcSlack
+            return estimate, math.log(1 / self.alpha) / nsamples / self.z
+
+        # the proportion of false outcomes of each stratum is shrunk towards the overall one for the variance, so that
+        # strata in which all the samples test true still contribute to the uncertainty
+        smoothed = (k_total - k_true + nsamples_false / nsamples) / (k_total + 1)
+        variance = np.dot(self.weights ** 2, smoothed * (1 - smoothed) / k_total)
+        return estimate, math.sqrt(variance)
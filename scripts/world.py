@@ -11,31 +11,13 @@ class World:
 
     def __init__(self, subworlds):
         self.subworlds = subworlds
-        self.collisions_cache = {}
-        self.num_nominal_coll_checks = 0
-        self.num_actual_coll_checks = 0
 
     def collides(self, footprint):
-        self.num_nominal_coll_checks += 1
-
-        # This computation is memoized 
-        cached_result = self.collisions_cache.get(footprint)
-        if cached_result is None:
-            self.num_actual_coll_checks += 1
-
-            collides = False
-            for subworld in self.subworlds:
-                if subworld.collides(footprint):
-                    collides = True
-            self.collisions_cache[footprint] = collides
-            return collides
-        else:
-            return cached_result
-
-        # for subworld in self.subworlds:
-        #     if subworld.collides(footprint):
-        #         return True
-        # return False
+        # memoized, vectorized collision checking against all worlds is provided by Scene.collides_batch
+        for subworld in self.subworlds:
+            if subworld.collides(footprint):
+                return True
+        return False
 
     def plot(self, colors):
         assert len(self.subworlds) == len(colors)
@@ -1,4 +1,9 @@
 import math
+from functools import lru_cache
+
+import numpy as np
+
+from sequential_test import SequentialTest, CONTINUE, FALSE, TRUE
 
 # Z-values for various significance levels
 ZTABLE = dict([(0.05, 1.645), (0.03, 1.88), (0.025, 1.96), (0.01, 2.33), (0.005, 2.58)])
@@ -7,45 +12,97 @@ def pr_gt(sample_func, prob=0.50, alpha=0.05, nsamples_init=30, nsamples_per_bat
     """
     Returns true if, according to a Z-test, the probability that the Bernoulli random variable is true is above threshold. The alternative hypothesis is that the probability is above threshold.
     """
+    return pr_gt_batch(lambda n: [sample_func() for _ in range(n)], prob, alpha, nsamples_init, nsamples_per_batch,
+                       nsamples_max)
+
+
+def pr_gt_batch(sample_batch_func, prob=0.50, alpha=0.05, nsamples_init=30, nsamples_per_batch=10, nsamples_max=300):
+    """
+    Same as pr_gt, but 'sample_batch_func(n)' returns the outcomes (a sequence of booleans) of n independent samples at once.
+    """
+    return _ztest(prob, alpha, nsamples_init, nsamples_per_batch, nsamples_max).pr_gt(sample_batch_func)
+
+
+@lru_cache(maxsize=None)
+def _ztest(*args):
+    return ZTest(*args)
+
+
+class ZTest(SequentialTest):
+    """
+    Precompiled Z-test (see pr_gt for the arguments). Build it once for a given set of parameters, then call pr_gt for
+    each proposition to test.
+    """
+
+    def __init__(self, prob=0.50, alpha=0.05, nsamples_init=30, nsamples_per_batch=10, nsamples_max=300):
+        if alpha not in ZTABLE:
+            raise ValueError("Significane level %f is not supported" % alpha)
+
+        # `calcSlack` imposes a lower bound on the minimum of samples needed
+        nsamples_min = math.ceil(math.log(1 / alpha) / (1 - prob))
+        if nsamples_init < nsamples_min:
+            nsamples_init = nsamples_min
+
+        super().__init__(nsamples_init, nsamples_per_batch)
+
+        # H0: Pr(sample = True) = prob
+        # H1: Pr(sample = True) > prob
+        self.prob = prob
+        self.alpha = alpha
+        self.nsamples_max = nsamples_max
+
+    def decisions(self, k_total, k_true):
+        prob = self.prob
+        nsamples_max = self.nsamples_max
+
+        slack = self.slack(k_total, k_true)
+
+        return np.select([prob <= k_true / k_total - slack,  # reject H0
+                          np.full(len(k_true), k_total >= nsamples_max),  # run out of samples
+                          prob > (nsamples_max - k_total + k_true) / nsamples_max - slack],  # unable to reach the threshold even when all remaining samples test true
+                         [TRUE, FALSE, FALSE], CONTINUE)
+
+    def slack(self, k_total, k_true):
+        return calcSlack(self.alpha, k_total, k_true)
+
+
+class FinitePopulationZTest(ZTest):
+    """
+    Z-test on samples drawn without replacement from a finite population of 'population' equally likely outcomes
+    (e.g., the worlds of a scene, visited in a random order). The slack is shrunk by the finite population correction,
+    down to zero once the whole population has been drawn, where the test decides on the exact proportion.
+    """
+
+    def __init__(self, prob=0.50, alpha=0.05, nsamples_init=30, nsamples_per_batch=10, nsamples_max=300, population=1000):
+        super().__init__(prob, alpha, nsamples_init, nsamples_per_batch, min(nsamples_max, population))
+        self.population = population
 
-    # `calcSlack` imposes a lower bound on the minimum of samples needed
-    nsamples_min = math.ceil(math.log(1 / alpha) / (1 - prob))
-    if nsamples_init < nsamples_min:
-        nsamples_init = nsamples_min
-
-    # H0: Pr(sample_func() = True) = prob
-    # H1: Pr(sample_func() = True) > prob
-
-    # nubmer of samples drawn so far
-    k_total = 0
-    # number of samples that test true
-    k_true = 0
-    # number of batches so far
-    b = 0
-
-    while True:
-        for _ in range(nsamples_init if b == 0 else nsamples_per_batch):
-            result = sample_func()
-            if result:
-                k_true += 1
-            k_total += 1
-        b += 1
-        slack = calcSlack(alpha, k_total, k_true)
-        if prob <= k_true / k_total - slack:
-            return True # reject H0
-        if k_total >= nsamples_max: # run out of samples
-            return False # accept H0
-        if prob > (nsamples_max - k_total + k_true) / nsamples_max - slack: # unable to reach the threshold even when all remaining samples test true
-            return False # accept H0
+    def checkpoint(self, b):
+        # the last batch may be truncated by the size of the population
+        return min(super().checkpoint(b), self.population)
+
+    def slack(self, k_total, k_true):
+        fpc = math.sqrt((self.population - k_total) / max(self.population - 1, 1))
+        return calcSlack(self.alpha, k_total, k_true) * fpc
 
 
 def calcSlack(alpha, nsamples, nsamples_true):
+    """
+    Works on a single number of samples that test true, or on a vector of them
+    """
 
     try:
         z = ZTABLE[alpha]
     except KeyError:
         raise ValueError("Significane level %f is not supported" % alpha)
 
+    if np.ndim(nsamples_true) > 0:
+        # beware of an all-True situation, per the book
+        partial = nsamples_true < nsamples
+        return np.where(partial,
+                        z / nsamples * np.sqrt(np.where(partial, nsamples_true - nsamples_true * nsamples_true / nsamples, 0)),
+                        math.log(1 / alpha) / nsamples)
+
     if nsamples_true == nsamples:
         # beware of an all-True situation, per the book
         return math.log(1 / alpha) / nsamples